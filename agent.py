@@ -7,9 +7,29 @@ import random
 from . import sock
 from . import sp_exceptions
 from . import handler
+from . import message_parser
 from .world_model import WorldModel
 
 class Agent:
+    # the message types this agent's world model needs, or None for all of
+    # them.  messages of other types are only parsed if they're accessed.
+    subscriptions = None
+
+    # whether the message loop receives every datagram waiting for it at once
+    # and skips all but the newest see message among them, so that it catches
+    # up with the server when thinking takes too long.  skipped sees are
+    # counted in the message handler's 'dropped_sees'.
+    drain_receive = False
+
+    # the size in bytes asked of the kernel for the socket's receive buffer
+    # (SO_RCVBUF), or None for the system default.  a bigger one keeps
+    # datagrams from being lost while we're busy.
+    receive_buffer_size = None
+
+    # how the world model finds the player's position, one of
+    # WorldModel.Localizers.
+    localizer = WorldModel.Localizers.CLUSTER
+
     def __init__(self):
         # whether we're connected to a server yet or not
         self.__connected = False
@@ -23,6 +43,7 @@ class Agent:
         # models and the message handler for parsing and storing information
         self.wm = None
         self.msg_handler = None
+        self.__splitter = None
 
         # parse thread and control variable
         self.__parsing = False
@@ -31,12 +52,22 @@ class Agent:
         self.__thinking = False  # think thread and control variable
         self._think_thread = None
 
-        # whether we should run the think method
-        self.__should_think_on_data = False
+        # guards the variables below, and wakes the think loop when the
+        # message loop changes them.
+        self.__condition = threading.Condition()
+
+        # the number of received datagrams handled so far, and the number
+        # there were when the think loop last thought.  think runs once for
+        # every change, however many datagrams arrived since the last time.
+        self.data_sequence = 0
+        self.thought_sequence = 0
 
         # whether we should send commands
         self.__send_commands = False
 
+        # set once the server first replies and tells us which port to use
+        self.__server_replied = threading.Event()
+
         # adding goal post markers
         self.enemy_goal_pos = None
         self.own_goal_pos = None
@@ -62,23 +93,20 @@ class Agent:
             raise sp_exceptions.AgentConnectionStateError(msg)
 
         # the pipe through which all of our communication takes place
-        self.__sock = sock.Socket(host, port)
-
-        # our models of the world and our body
-        self.wm = WorldModel(handler.ActionHandler(self.__sock))
+        self.__sock = sock.Socket(host, port,
+                                  rcvbuf=self.receive_buffer_size)
 
-        # set the team name of the world model to the given name
-        self.wm.teamname = teamname
+        self.attach(self.__sock, teamname)
 
-        # handles all messages received from the server
-        self.msg_handler = handler.MessageHandler(self.wm)
+        # splits received data into complete messages, keeping any partial
+        # message around until the rest of it arrives.
+        self.__splitter = message_parser.MessageSplitter()
 
         # set up our threaded message receiving system
         self.__parsing = True  # tell thread that we're currently running
 
         # send the init message and allow the message handler to handle further
         # responses.
-        init_address = self.__sock.address
         init_msg = "(init %s (version %d))"
         self.__sock.send(init_msg % (teamname, version))
 
@@ -92,8 +120,7 @@ class Agent:
 
         # wait until the socket receives a response from the server and gets its
         # assigned port.
-        while self.__sock.address == init_address:
-            time.sleep(0.0001)
+        self.__server_replied.wait()
 
         # create our thinking thread.  this will perform the actions necessary
         # to play a game of robo-soccer.
@@ -106,6 +133,25 @@ class Agent:
         # something goes wrong beforehand.
         self.__connected = True
 
+    def attach(self, server_socket, teamname):
+        """
+        Creates the world model and message handler, with commands going out
+        through the given socket, which only needs a 'send' method like
+        sock.Socket's.  connect does this itself, but agents run some other
+        way, like on an event loop (see runtime), call it directly.
+        """
+
+        # our models of the world and our body
+        self.wm = WorldModel(handler.ActionHandler(server_socket),
+                             localizer=self.localizer)
+
+        # set the team name of the world model to the given name
+        self.wm.teamname = teamname
+
+        # handles all messages received from the server
+        self.msg_handler = handler.MessageHandler(self.wm,
+                                                  subscriptions=self.subscriptions)
+
     def play(self):
         """
         Kicks off the thread that does the agent's thinking, allowing it to play
@@ -126,9 +172,10 @@ class Agent:
         # run the method that sets up the agent's persistant variables
         self.setup_environment()
 
-        # tell the thread that it should be running, then start it
+        # tell the thread that it should be running, then start it.  it thinks
+        # once right away, whether or not new data has arrived.
         self.__thinking = True
-        self.__should_think_on_data = True
+        self.thought_sequence = self.data_sequence - 1
         self._think_thread.start()
 
     def disconnect(self):
@@ -150,9 +197,11 @@ class Agent:
         if not self.__connected:
             return
 
-        # tell the loops to terminate
-        self.__parsing = False
-        self.__thinking = False
+        # tell the loops to terminate, waking the think loop if it's waiting
+        with self.__condition:
+            self.__parsing = False
+            self.__thinking = False
+            self.__condition.notify_all()
 
         # tell the server that we're quitting
         self.__sock.send("(bye)")
@@ -180,19 +229,35 @@ class Agent:
 
         # loop until we're told to stop
         while self.__parsing:
-            # receive message data from the server and pass it along to the
-            # world model as-is.  the world model parses it and stores it within
-            # itself for perusal at our leisure.
-            raw_msg = self.__sock.recv()
-            msg_type = self.msg_handler.handle_message(raw_msg)
+            # receive message data from the server and pass every message it
+            # contains along to the world model as-is.  the world model parses
+            # it and stores it within itself for perusal at our leisure.
+            # datagrams are received into the socket's reusable buffer, from
+            # which each message is copied once.
+            if self.drain_receive:
+                msgs = []
+                for size in self.__sock.recv_pending_into_buffer():
+                    msgs.extend(self.__splitter.feed_buffer(self.__sock.buffer,
+                                                            size))
+            else:
+                size = self.__sock.recv_into_buffer()
+                msgs = self.__splitter.feed_buffer(self.__sock.buffer, size)
+            self.__server_replied.set()
+
+            msg_types = self.msg_handler.handle_messages(
+                msgs, drop_stale_sees=self.drain_receive)
 
             # we send commands all at once every cycle, ie. whenever a
             # 'sense_body' command is received
-            if msg_type == handler.ActionHandler.CommandType.SENSE_BODY:
-                self.__send_commands = True
+            send_commands = (handler.ActionHandler.CommandType.SENSE_BODY in
+                             msg_types)
 
             # flag new data as needing the think loop's attention
-            self.__should_think_on_data = True
+            with self.__condition:
+                self.data_sequence += 1
+                if send_commands:
+                    self.__send_commands = True
+                self.__condition.notify()
 
     def __think_loop(self):
         """
@@ -203,25 +268,40 @@ class Agent:
         play method to start play, and the disconnect method to end it.
         """
 
-        while self.__thinking:
-            # tell the ActionHandler to send its enqueued messages if it is time
-            if self.__send_commands:
+        while True:
+            # sleep until there's new data or commands to send, or we're told
+            # to stop.  the message loop wakes us.
+            with self.__condition:
+                while (self.__thinking and not self.__send_commands and
+                       self.data_sequence == self.thought_sequence):
+                    self.__condition.wait()
+
+                if not self.__thinking:
+                    return
+
+                send_commands = self.__send_commands
                 self.__send_commands = False
+                sequence = self.data_sequence
+
+                # keep the see data we're about to read from being reused by
+                # see messages that arrive while we think.
+                thinking = sequence != self.thought_sequence
+                if thinking:
+                    self.wm.hold_see_data()
+
+            # tell the ActionHandler to send its enqueued messages if it is time
+            if send_commands:
                 self.wm.ah.send_commands()
 
             # only think if new data has arrived
-            if self.__should_think_on_data:
-                # flag that data has been processed.  this shouldn't be a race
-                # condition, since the only change would be to make it True
-                # before changing it to False again, and we're already going to
-                # process data, so it doesn't make any difference.
-                self.__should_think_on_data = False
+            if thinking:
+                self.thought_sequence = sequence
 
                 # performs the actions necessary for the agent to play soccer
-                self.think()
-            else:
-                # prevent from burning up all the cpu time while waiting for data
-                time.sleep(0.0001)
+                try:
+                    self.think()
+                finally:
+                    self.wm.release_see_data()
 
     def setup_environment(self):
         """
@@ -238,8 +318,11 @@ class Agent:
         iteration of our think loop.
         """
 
-        # DEBUG:  tells us if a thread dies
-        if not self._think_thread.is_alive() or not self._msg_thread.is_alive():
+        # DEBUG:  tells us if a thread dies.  agents run on an event loop
+        # don't have any.
+        if self._think_thread is not None and (
+                not self._think_thread.is_alive() or
+                not self._msg_thread.is_alive()):
             raise Exception("A thread died.")
 
         # take places on the field by uniform number
@@ -335,7 +418,7 @@ if __name__ == "__main__":
 
     # enforce corrent number of arguments, print help otherwise
     if len(sys.argv) < 3:
-        print "args: ./agent.py <team_name> <num_players>"
+        print("args: ./agent.py <team_name> <num_players>")
         sys.exit()
 
     def spawn_agent(team_name):
@@ -354,8 +437,8 @@ if __name__ == "__main__":
 
     # spawn all agents as seperate processes for maximum processing efficiency
     agentthreads = []
-    for agent in xrange(min(11, int(sys.argv[2]))):
-        print "  Spawning agent %d..." % agent
+    for agent in range(min(11, int(sys.argv[2]))):
+        print("  Spawning agent %d..." % agent)
 
         at = mp.Process(target=spawn_agent, args=(sys.argv[1],))
         at.daemon = True
@@ -363,27 +446,27 @@ if __name__ == "__main__":
 
         agentthreads.append(at)
 
-    print "Spawned %d agents." % len(agentthreads)
-    print
-    print "Playing soccer..."
+    print("Spawned %d agents." % len(agentthreads))
+    print()
+    print("Playing soccer...")
 
     # wait until killed to terminate agent processes
     try:
         while 1:
             time.sleep(0.05)
     except KeyboardInterrupt:
-        print
-        print "Killing agent threads..."
+        print()
+        print("Killing agent threads...")
 
         # terminate all agent processes
         count = 0
         for at in agentthreads:
-            print "  Terminating agent %d..." % count
+            print("  Terminating agent %d..." % count)
             at.terminate()
             count += 1
-        print "Killed %d agent threads." % (count - 1)
+        print("Killed %d agent threads." % (count - 1))
 
-        print
-        print "Exiting."
+        print()
+        print("Exiting.")
         sys.exit()
 
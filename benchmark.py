@@ -0,0 +1,989 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmarks for the hot paths of the client, replayed over a recorded
+server message log such as the bundled 'client_recv' file.
+
+Run as a module from the directory containing this package, ex:
+
+    python -m soccerpy.benchmark parse soccerpy/client_recv
+"""
+
+import asyncio
+import gc
+import math
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from . import game_object
+from .agent import Agent
+from . import geometry
+from . import handler
+from . import localization
+from . import message_parser
+from . import runtime
+from . import sock
+from . import spatial
+from .world_model import WorldModel
+
+# the message log recorded from a real game, bundled alongside this module
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "client_recv")
+
+def load_corpus(path=DEFAULT_CORPUS):
+    """
+    Returns a list of every raw message (bytes) in the given log file, one per
+    line, as they would have been received from the server.
+    """
+
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def time_calls(func, items, repeat=5):
+    """
+    Calls func on every item, 'repeat' times over, and returns the best total
+    time in seconds for a single pass over all the items.  Like timeit, the
+    garbage collector is disabled while timing.
+    """
+
+    best = None
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start = time.perf_counter()
+            for item in items:
+                func(item)
+            elapsed = time.perf_counter() - start
+
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return best
+
+def report(name, before, after, count):
+    """
+    Prints the per-item cost of some 'before' and 'after' timings along with
+    the speedup between them.
+    """
+
+    print("%s (%d messages):" % (name, count))
+    print("  before: %8.2f us/msg" % (before / count * 1e6))
+    print("  after:  %8.2f us/msg" % (after / count * 1e6))
+    print("  speedup: %.2fx" % (before / after))
+
+def bench_parse(corpus):
+    """
+    Compares the token-level parser against the character-at-a-time one,
+    making sure they agree on every message first.
+    """
+
+    for msg in corpus:
+        if message_parser.parse(msg) != message_parser.parse_chars(msg):
+            raise AssertionError("Parsers disagree on message: %r" % msg[:80])
+
+    before = time_calls(message_parser.parse_chars, corpus)
+    after = time_calls(message_parser.parse, corpus)
+
+    report("parse", before, after, len(corpus))
+
+class StoreOnlyWorldModel(WorldModel):
+    """
+    A world model that only stores what it's given, so that benchmarks of the
+    message handling code aren't dominated by localization.
+    """
+
+    def process_new_info(self, ball, flags, goals, players, lines,
+                         flag_arrays=None):
+        self.ball = ball
+        self.flags = flags
+        self.goals = goals
+        self.players = players
+        self.lines = lines
+
+        if flag_arrays is not None:
+            self.flag_indexes, self.flag_distances, self.flag_directions = flag_arrays
+
+def bench_decode(corpus):
+    """
+    Compares handling see, sense_body, and hear messages through their
+    type-specific decoders against the generic parser and '_handle_*' path.
+    """
+
+    for head in (b"see", b"sense_body", b"hear"):
+        msgs = [m for m in corpus if message_parser.peek_head(m) == head]
+
+        generic = handler.MessageHandler(StoreOnlyWorldModel(None))
+        generic.decoders = {}
+        decoded = handler.MessageHandler(StoreOnlyWorldModel(None))
+
+        before = time_calls(generic.handle_message, msgs)
+        after = time_calls(decoded.handle_message, msgs)
+
+        report("decode %s" % head.decode(), before, after, len(msgs))
+
+def bench_see_frame(corpus):
+    """
+    Compares storing see messages as SeeFrame arrays against storing them as
+    lists of GameObjects.
+    """
+
+    msgs = [m for m in corpus if message_parser.peek_head(m) == b"see"]
+
+    objects = handler.MessageHandler(StoreOnlyWorldModel(None))
+    frames = handler.MessageHandler(StoreOnlyWorldModel(None))
+    frames.see_frames = True
+
+    before = time_calls(objects.handle_message, msgs)
+    after = time_calls(frames.handle_message, msgs)
+
+    report("see_frame", before, after, len(msgs))
+
+def allocated_bytes(func, items):
+    """
+    Calls func on every item and returns the average number of bytes that
+    were newly allocated while handling each one, measured with tracemalloc
+    as the peak memory use during the call over the memory in use before it.
+    """
+
+    total = 0
+    tracemalloc.start()
+    try:
+        for item in items:
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            func(item)
+            _, peak = tracemalloc.get_traced_memory()
+
+            total += peak - start
+    finally:
+        tracemalloc.stop()
+
+    return total / len(items)
+
+def bench_see_alloc(corpus):
+    """
+    Compares the memory allocated for each see message when it's stored as
+    new GameObjects, as pooled compact objects, and as a SeeFrame.
+    """
+
+    msgs = [m for m in corpus if message_parser.peek_head(m) == b"see"]
+
+    objects = handler.MessageHandler(StoreOnlyWorldModel(None))
+    pooled = handler.MessageHandler(StoreOnlyWorldModel(None))
+    pooled.pool_objects = True
+    frames = handler.MessageHandler(StoreOnlyWorldModel(None))
+    frames.see_frames = True
+
+    print("see_alloc (%d messages):" % len(msgs))
+    for name, h in (("objects", objects), ("pooled", pooled),
+                    ("frames", frames)):
+        # run once first so that pools and caches are already filled
+        for msg in msgs:
+            h.handle_message(msg)
+
+        allocated = allocated_bytes(h.handle_message, msgs)
+        elapsed = time_calls(h.handle_message, msgs)
+        print("  %-8s %8.0f bytes/msg %8.2f us/msg" %
+              (name + ":", allocated, elapsed / len(msgs) * 1e6))
+
+def see_flags(corpus):
+    """
+    Returns the flags of every see message in the corpus, as a list of
+    (flags, flag indexes, flag distances) tuples.
+    """
+
+    wm = StoreOnlyWorldModel(None)
+    h = handler.MessageHandler(wm)
+    h.see_frames = False
+    h.pool_objects = False
+
+    flags = []
+    for msg in corpus:
+        if message_parser.peek_head(msg) == b"see":
+            h.handle_message(msg)
+            flags.append((wm.flags, wm.flag_indexes, wm.flag_distances))
+
+    return flags
+
+def bench_localize(corpus, tolerance=1e-6):
+    """
+    Compares finding the player's position with the point-at-a-time
+    triangulate_position against the array-based
+    triangulate_position_arrays, making sure they find the same position for
+    every see message first.
+    """
+
+    wm = WorldModel(None)
+    flag_dict = game_object.Flag.FLAG_COORDS
+    frames = see_flags(corpus)
+
+    # both use random cluster centers, so they get the same random state
+    for i, (flags, indexes, distances) in enumerate(frames):
+        random.seed(i)
+        expected = wm.triangulate_position(flags, flag_dict)
+        random.seed(i)
+        actual = wm.triangulate_position_arrays(indexes, distances)
+
+        if (abs(expected[0] - actual[0]) > tolerance or
+                abs(expected[1] - actual[1]) > tolerance):
+            raise AssertionError("Positions differ for see message %d: %r, %r"
+                                 % (i, expected, actual))
+
+    before = time_calls(lambda f: wm.triangulate_position(f[0], flag_dict),
+                        frames, repeat=3)
+    after = time_calls(lambda f: wm.triangulate_position_arrays(f[1], f[2]),
+                       frames, repeat=3)
+
+    report("localize", before, after, len(frames))
+
+def bench_localizers(corpus):
+    """
+    Compares finding the player's position by clustering, by trilateration,
+    and by looking it up in a DistanceGrid.  The recorded games don't say where the player really was,
+    so accuracy is judged by how far off the flag distances are from the
+    found position, and by how much the position moves when clustering is
+    run again with a different random state.
+    """
+
+    wm = WorldModel(None)
+    coords = game_object.Flag.FLAG_COORDS_ARRAY
+    frames = [(i, d) for _, i, d in see_flags(corpus)
+              if (~np.isnan(d)).sum() >= 2]
+
+    def cluster(frame):
+        return wm.triangulate_position_arrays(frame[0], frame[1])
+
+    def trilaterate(frame):
+        return wm.trilaterate_position(frame[0], frame[1])
+
+    start = time.perf_counter()
+    grid = localization.DistanceGrid(coords, WorldModel.GRID_RESOLUTION)
+    print("localizers (%d messages, %.0f ms to build the grid):" %
+          (len(frames), (time.perf_counter() - start) * 1e3))
+
+    def lookup(frame):
+        return grid.locate(frame[0], frame[1])
+
+    for name, locate in (("cluster", cluster), ("trilaterate", trilaterate),
+                         ("grid", lookup)):
+        random.seed(0)
+        first = [locate(f) for f in frames]
+        random.seed(1)
+        second = [locate(f) for f in frames]
+
+        errors = [np.nanmedian(localization.relative_errors(np.array(p),
+                                                              coords[i], d))
+                  for p, (i, d) in zip(first, frames)]
+        jitter = [math.hypot(a[0] - b[0], a[1] - b[1])
+                  for a, b in zip(first, second)]
+        elapsed = time_calls(locate, frames, repeat=3)
+
+        print("  %-12s %8.2f us/msg  median distance error %5.1f%%  "
+              "mean jitter %5.2f" % (name + ":", elapsed / len(frames) * 1e6,
+                                    100 * np.median(errors),
+                                    sum(jitter) / len(jitter)))
+
+def bench_filter(corpus):
+    """
+    Compares replaying the corpus with the trilateration localizer, which
+    finds the position from scratch on every see, against the filter
+    localizer, which moves it every cycle and corrects it on every see.  The
+    time of the whole replay is reported per see message.
+    """
+
+    def replay(localizer):
+        wm = WorldModel(None, localizer)
+        wm.teamname = "team_jason"
+        h = handler.MessageHandler(wm)
+
+        positions = []
+        start = time.perf_counter()
+        for msg in corpus:
+            h.handle_message(msg)
+            positions.append(wm.abs_coords)
+        elapsed = time.perf_counter() - start
+
+        return wm, positions, elapsed
+
+    _, before_positions, before = replay(WorldModel.Localizers.TRILATERATE)
+    wm, after_positions, after = replay(WorldModel.Localizers.FILTER)
+
+    sees = sum(1 for m in corpus if message_parser.peek_head(m) == b"see")
+    report("filter", before, after, sees)
+
+    differences = sorted(math.hypot(a[0] - b[0], a[1] - b[1])
+                         for a, b in zip(before_positions, after_positions)
+                         if a[0] is not None and b[0] is not None)
+    print("  median distance from trilateration: %.2f" %
+          differences[len(differences) // 2])
+    print("  filter resets: %d" % wm.position_filter.resets)
+
+def bench_cache(corpus, repeat=5):
+    """
+    Compares a think-heavy agent, one that asks for the same derived values
+    several times a cycle, with and without the world model's cycle cache.
+    Reports the cache's hit and miss counts.
+    """
+
+    points = [(55, 0), (-55, 0), (0, 0), (52.5, 34), (52.5, -34)]
+
+    def think(wm):
+        for i in range(repeat):
+            for point in points:
+                wm.get_distance_to_point(point)
+                wm.angle_between_points(wm.abs_coords, point)
+
+            if wm.ball is not None:
+                wm.get_object_absolute_coords(wm.ball)
+
+    def replay(enabled):
+        wm = WorldModel(None)
+        wm.teamname = "team_jason"
+        wm.cycle_cache.enabled = enabled
+        h = handler.MessageHandler(wm)
+
+        # only time the thinking, not the message handling
+        elapsed = 0
+        for msg in corpus:
+            h.handle_message(msg)
+
+            start = time.perf_counter()
+            think(wm)
+            elapsed += time.perf_counter() - start
+
+        return wm, elapsed
+
+    _, before = replay(False)
+    wm, after = replay(True)
+
+    report("cache", before, after, len(corpus))
+    print("  hits: %d, misses: %d" % (wm.cycle_cache.hits,
+                                      wm.cycle_cache.misses))
+
+def bench_geometry(corpus):
+    """
+    Compares placing the ball and 22 players on the field and finding every
+    one's distance and angle from us and from the ball with the world model's
+    single-point methods, against doing the same with a few geometry array
+    operations.  Uses random positions like bench_spatial.
+    """
+
+    rng = np.random.default_rng(0)
+    wm = WorldModel(None)
+    wm.abs_coords = (-10.0, 5.0)
+    wm.abs_neck_dir = 30.0
+
+    # distances and directions of the ball and then the players
+    distances = rng.uniform(1, 50, 23)
+    directions = rng.uniform(-45, 45, 23)
+    seen = list(zip(distances.tolist(), directions.tolist()))
+
+    def one_at_a_time(seen):
+        origin = wm.abs_coords
+        points = []
+        for distance, direction in seen:
+            angle = math.radians(wm.abs_neck_dir - direction)
+            points.append((origin[0] + distance * math.cos(angle),
+                           origin[1] + distance * math.sin(angle)))
+
+        ball = points[0]
+        for p in points:
+            wm.euclidean_distance(origin, p)
+            wm.euclidean_distance(ball, p)
+            wm.angle_between_points(origin, p)
+
+    def batched(seen):
+        points = geometry.polar_to_cartesian(wm.abs_coords, wm.abs_neck_dir,
+                                             distances, directions)
+        geometry.distance_matrix(points[:1], points)
+        geometry.distances(points, wm.abs_coords)
+        geometry.bearings(wm.abs_coords, points)
+
+    # the per-point methods are cached per cycle, so turn that off
+    wm.cycle_cache.enabled = False
+
+    before = time_calls(one_at_a_time, [seen] * 100)
+    after = time_calls(batched, [seen] * 100)
+
+    print("geometry (ball and 22 players, per cycle):")
+    print("  before: %8.2f us/cycle" % (before / 100 * 1e6))
+    print("  after:  %8.2f us/cycle" % (after / 100 * 1e6))
+    print("  speedup: %.2fx" % (before / after))
+
+def bench_history(corpus, records=10000):
+    """
+    Measures the time and memory it takes to add a history record for a
+    cycle, and to query the last 50 cycles, once the whole corpus has been
+    handled by a world model keeping history.
+    """
+
+    wm = WorldModel(None, history_depth=300)
+    h = handler.MessageHandler(wm)
+    for msg in corpus:
+        h.handle_message(msg)
+
+    cycles = [None] * records
+    elapsed = time_calls(lambda c: wm.record_history(), cycles)
+    peak = allocated_bytes(lambda c: wm.record_history(), cycles[:1000])
+
+    # memory still held after adding many records, which should be none
+    # since the records are all preallocated.
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for c in cycles:
+            wm.record_history()
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    def query(c):
+        wm.history.ball_positions(50)
+        wm.history.mean_ball_speed(50)
+
+    queries = time_calls(query, cycles[:1000])
+
+    print("history (depth %d, %d records):" % (wm.history.depth, records))
+    print("  record: %8.2f us %8.0f bytes peak %8.0f bytes kept in total" %
+          (elapsed / records * 1e6, peak, end - start))
+    print("  query:  %8.2f us for the last 50 cycles" % (queries / 1000 * 1e6))
+
+class TimingAgent(Agent):
+    """
+    An agent that only records when it thinks, for bench_think.
+    """
+
+    def setup_environment(self):
+        self.think_times = []
+
+    def think(self):
+        self.think_times.append(time.perf_counter())
+
+def answer_inits(server, corpus, count):
+    """
+    Starts a thread that answers 'count' agents' init messages sent to the
+    given bound UDP socket, which stands in for the server, with the corpus'
+    first message.  Returns the thread and the list the agents' addresses are
+    added to.
+    """
+
+    addresses = []
+
+    def answer():
+        while len(addresses) < count:
+            # skip anything left over from earlier agents, like their '(bye)'
+            data, address = server.recvfrom(8192)
+            if data.startswith(b"(init"):
+                server.sendto(corpus[0] + b"\0", address)
+                addresses.append(address)
+
+    thread = threading.Thread(target=answer)
+    thread.start()
+
+    return thread, addresses
+
+def replay_server(server, corpus):
+    """
+    Connects a TimingAgent through the given bound UDP socket standing in for
+    the server.  Returns the connected agent and its address.
+    """
+
+    thread, addresses = answer_inits(server, corpus, 1)
+
+    a = TimingAgent()
+    a.connect(*server.getsockname(), teamname="team_jason")
+    thread.join()
+
+    return a, addresses[0]
+
+def replay(server, corpus, addresses, count, interval):
+    """
+    Sends each of the first 'count' messages of the corpus after the init
+    reply to every one of the given addresses, 'interval' seconds apart.
+    Returns the time each was sent at.
+    """
+
+    send_times = []
+    for msg in corpus[1:count + 1]:
+        send_times.append(time.perf_counter())
+        for address in addresses:
+            server.sendto(msg + b"\0", address)
+        time.sleep(interval)
+
+    return send_times
+
+def think_latencies(send_times, think_times):
+    """
+    Returns the time from every send to the first think after it.
+    """
+
+    think_times = np.array(think_times)
+    first = np.searchsorted(think_times, send_times)
+    first = first[first < len(think_times)]
+
+    return think_times[first] - np.array(send_times)[:len(first)]
+
+def bench_think(corpus, idle_time=1.0, interval=0.005, count=300):
+    """
+    Compares an agent's think loop waiting for data on a condition variable
+    against polling for it every 0.1 ms, the way it used to, by the CPU time
+    used while no data arrives and the time from a datagram being sent to
+    the first think after it.  A local UDP socket stands in for the server
+    and replays the corpus, 'interval' seconds between datagrams.
+    """
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+
+    def run(agent, address, think_times):
+        # CPU time used with nothing to do
+        start = time.process_time()
+        time.sleep(idle_time)
+        idle = (time.process_time() - start) / idle_time
+
+        del think_times[:]
+        send_times = replay(server, corpus, [address], count, interval)
+
+        latencies = think_latencies(send_times, think_times)
+        return idle, latencies
+
+    def polling_loop(agent, think_times, running):
+        # the old think loop: check for new data, sleep 0.1 ms if there's none
+        seen = agent.data_sequence
+        while running:
+            if agent.data_sequence != seen:
+                seen = agent.data_sequence
+                think_times.append(time.perf_counter())
+            else:
+                time.sleep(0.0001)
+
+    try:
+        # before: an agent without its own think loop, watched by a polling one
+        a, address = replay_server(server, corpus)
+        a.setup_environment()
+        running = [True]
+        poller = threading.Thread(target=polling_loop,
+                                  args=(a, a.think_times, running))
+        poller.daemon = True
+        poller.start()
+        before = run(a, address, a.think_times)
+        running.pop()
+        poller.join()
+        a.disconnect()
+
+        # after: the agent's own think loop
+        a, address = replay_server(server, corpus)
+        a.play()
+        after = run(a, address, a.think_times)
+        a.disconnect()
+    finally:
+        server.close()
+
+    print("think (%d datagrams, %.0f ms apart):" % (count, interval * 1e3))
+    for name, (idle, latencies) in (("before", before), ("after", after)):
+        print("  %-7s idle CPU %5.1f%%  latency median %7.1f us  p99 %7.1f us" %
+              (name + ":", idle * 100, np.median(latencies) * 1e6,
+               np.percentile(latencies, 99) * 1e6))
+
+def bench_drain(corpus, backlog=30):
+    """
+    Compares catching up on a backlog of datagrams one at a time, handling
+    every see, against draining them all at once and handling only the
+    newest see.  A local UDP socket stands in for the server and sends the
+    corpus in bursts of 'backlog' datagrams, as if thinking had kept the
+    agent from receiving for a few cycles, and each burst is handled before
+    the next is sent.
+    """
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+
+    def run(drain):
+        wm = WorldModel(None)
+        wm.teamname = "team_jason"
+        h = handler.MessageHandler(wm)
+        splitter = message_parser.MessageSplitter()
+
+        # the server learns our address from the first thing we send it
+        client = sock.Socket(*server.getsockname())
+        client.send("(init team_jason)")
+        _, address = server.recvfrom(8192)
+
+        elapsed = 0.0
+        see_times = []
+        for i in range(0, len(corpus), backlog):
+            burst = corpus[i:i + backlog]
+            for msg in burst:
+                server.sendto(msg + b"\0", address)
+
+            start = time.perf_counter()
+            received = 0
+            while received < len(burst):
+                # both receive into the socket's reusable buffer, like the
+                # agent's message loop.
+                if drain:
+                    sizes = client.recv_pending_into_buffer()
+                else:
+                    sizes = [client.recv_into_buffer()]
+
+                msgs = []
+                for size in sizes:
+                    msgs.extend(splitter.feed_buffer(client.buffer, size))
+                    received += 1
+                h.handle_messages(msgs, drop_stale_sees=drain)
+            elapsed += time.perf_counter() - start
+
+            see_times.append(wm.sim_time)
+
+        client.sock.close()
+        return elapsed, h.dropped_sees, see_times
+
+    try:
+        before = run(False)
+        after = run(True)
+    finally:
+        server.close()
+
+    bursts = len(before[2])
+    print("drain (%d bursts of %d datagrams):" % (bursts, backlog))
+    for name, (elapsed, dropped, see_times) in (("before", before),
+                                                ("after", after)):
+        print("  %-7s %8.0f us/burst  %4d sees dropped" %
+              (name + ":", elapsed / bursts * 1e6, dropped))
+    print("  speedup: %.2fx, same latest see after every burst: %s" %
+          (before[0] / after[0], before[2] == after[2]))
+
+def bench_recv(corpus, backlog=30):
+    """
+    Compares receiving each datagram as new bytes and splitting it into
+    messages against receiving it into the socket's reusable buffer and
+    copying each message out of it once, by the time and memory allocated
+    per datagram.  A local UDP socket stands in for the server and sends the
+    corpus in bursts of 'backlog' datagrams.
+    """
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+
+    def run(into_buffer, trace):
+        splitter = message_parser.MessageSplitter()
+
+        # the server learns our address from the first thing we send it
+        client = sock.Socket(*server.getsockname())
+        client.send("(init team_jason)")
+        _, address = server.recvfrom(8192)
+
+        # time is only measured without tracing, which slows allocation
+        measured = 0
+        received = []
+        if trace:
+            tracemalloc.start()
+        try:
+            for i in range(0, len(corpus), backlog):
+                burst = corpus[i:i + backlog]
+                for msg in burst:
+                    server.sendto(msg + b"\0", address)
+
+                for msg in burst:
+                    if trace:
+                        tracemalloc.reset_peak()
+                        before, _ = tracemalloc.get_traced_memory()
+                    start = time.perf_counter()
+                    if into_buffer:
+                        size = client.recv_into_buffer()
+                        msgs = splitter.feed_buffer(client.buffer, size)
+                    else:
+                        msgs = splitter.feed(client.recv())
+                    if trace:
+                        _, peak = tracemalloc.get_traced_memory()
+                        measured += peak - before
+                    else:
+                        measured += time.perf_counter() - start
+
+                    # kept outside of the measurement, for the comparison
+                    received.extend(bytes(m) for m in msgs)
+        finally:
+            if trace:
+                tracemalloc.stop()
+
+        client.sock.close()
+        return measured, received
+
+    try:
+        results = []
+        for into_buffer in (False, True):
+            elapsed, received = run(into_buffer, False)
+            allocated, _ = run(into_buffer, True)
+            results.append((elapsed, allocated, received))
+    finally:
+        server.close()
+
+    before, after = results
+    count = len(corpus)
+    print("recv (%d datagrams):" % count)
+    for name, (elapsed, allocated, _) in (("before", before),
+                                          ("after", after)):
+        print("  %-7s %8.2f us/datagram %8.0f bytes/datagram" %
+              (name + ":", elapsed / count * 1e6, allocated / count))
+    print("  speedup: %.2fx, same messages: %s" %
+          (before[0] / after[0], before[2] == after[2]))
+
+def bench_runtime(corpus, agents=11, interval=0.01, count=100):
+    """
+    Compares a team of agents each running its own two threads against the
+    same team sharing one asyncio event loop, by the CPU time used per cycle
+    and the time from a datagram being sent to each agent's next think.  A
+    local UDP socket stands in for the server and replays the corpus to
+    every agent, 'interval' seconds between datagrams.
+    """
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    host, port = server.getsockname()
+
+    def measure(team, addresses, baseline):
+        # the threads the team added, besides the one replaying to it
+        threads = threading.active_count() - baseline - 1
+        start = time.process_time()
+        send_times = replay(server, corpus, addresses, count, interval)
+        cpu = (time.process_time() - start) / count
+
+        latencies = np.concatenate([think_latencies(send_times, a.think_times)
+                                    for a in team])
+        return threads, cpu, latencies
+
+    async def run_on_loop():
+        baseline = threading.active_count()
+        thread, addresses = answer_inits(server, corpus, agents)
+
+        team = [TimingAgent() for i in range(agents)]
+        protocols = []
+        for a in team:
+            protocols.append(await runtime.connect(a, host, port, "team_jason"))
+            a.setup_environment()
+        thread.join()
+
+        for p in protocols:
+            p.play()
+
+        # replay from another thread, so that the loop is free to receive
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, measure, team, addresses,
+                                            baseline)
+
+        for p in protocols:
+            p.disconnect()
+
+        return result
+
+    try:
+        # before: every agent with its own message and think threads
+        baseline = threading.active_count()
+        thread, addresses = answer_inits(server, corpus, agents)
+        team = []
+        for i in range(agents):
+            a = TimingAgent()
+            a.connect(host, port, "team_jason")
+            team.append(a)
+        thread.join()
+
+        for a in team:
+            a.play()
+
+        before = measure(team, addresses, baseline - 1)
+        for a in team:
+            a.disconnect()
+
+        # after: the whole team on one event loop
+        after = asyncio.run(run_on_loop())
+    finally:
+        server.close()
+
+    print("runtime (%d agents, %d datagrams each, %.0f ms apart):" %
+          (agents, count, interval * 1e3))
+    for name, (threads, cpu, latencies) in (("before", before),
+                                            ("after", after)):
+        print("  %-7s %3d threads  %7.0f us CPU/cycle  latency median "
+              "%7.1f us  p99 %7.1f us" %
+              (name + ":", threads, cpu * 1e6, np.median(latencies) * 1e6,
+               np.percentile(latencies, 99) * 1e6))
+
+def bench_send(corpus, cycles=2000):
+    """
+    Compares sending each cycle's commands in a datagram each against
+    sending them together in one, by the time taken and sendto calls made
+    per cycle.  Every cycle sends a turn_neck and two says, and a dash
+    that's replaced by a turn.  A local UDP socket stands in for the
+    server and checks that it receives the same commands either way.
+    """
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+
+    def run(batch):
+        client = sock.Socket(*server.getsockname())
+        ah = handler.ActionHandler(client)
+        ah.batch_commands = batch
+
+        elapsed = 0.0
+        received = []
+        for i in range(cycles):
+            ah.turn_neck(i % 90)
+            ah.say("cycle%d" % i)
+            ah.say("hello")
+            ah.dash(80)
+            ah.turn(i % 180)
+
+            start = time.perf_counter()
+            ah.send_commands()
+            elapsed += time.perf_counter() - start
+
+            # receive what was sent before the server's buffer fills up
+            for j in range(ah.cycle_syscalls):
+                received.append(server.recv(8192).rstrip(b"\0"))
+
+        client.sock.close()
+        return elapsed, ah, b"".join(received)
+
+    try:
+        before = run(False)
+        after = run(True)
+    finally:
+        server.close()
+
+    print("send (%d cycles):" % cycles)
+    for name, (elapsed, ah, _) in (("before", before), ("after", after)):
+        print("  %-7s %6.2f us/cycle  %.1f sendto/cycle  %.1f sent/cycle  "
+              "%.1f dropped/cycle" %
+              (name + ":", elapsed / cycles * 1e6, ah.syscalls / ah.cycles,
+               ah.commands_sent / ah.cycles, ah.commands_dropped / ah.cycles))
+    print("  speedup: %.2fx, same commands: %s" %
+          (before[0] / after[0], before[2] == after[2]))
+
+def bench_spatial(corpus, queries=50):
+    """
+    Compares finding the nearest teammate to each of many points one point at
+    a time, the way get_nearest_teammate_to_point used to, against asking a
+    PlayerIndex for all of them at once.  The recorded game has too few
+    players in view, so this uses 22 players at random positions instead of
+    the corpus.
+    """
+
+    rng = np.random.default_rng(0)
+    players = [object() for i in range(22)]
+    positions = rng.uniform((-52.5, -34), (52.5, 34), (22, 2))
+    sides = np.repeat((0, 1), 11)
+    points = [tuple(p) for p in rng.uniform((-52.5, -34), (52.5, 34),
+                                            (queries, 2))]
+
+    coords = [tuple(p) for p in positions]
+
+    def one_at_a_time(points):
+        for point in points:
+            distances = []
+            for i, p in enumerate(players):
+                if sides[i] == 0:
+                    d = math.hypot(point[0] - coords[i][0],
+                                   point[1] - coords[i][1])
+                    distances.append((d, i))
+
+            min(distances)
+
+    def batched(points):
+        index = spatial.PlayerIndex(players, positions, sides, 0)
+        index.nearest_to_points(points, index.TEAMMATES)
+
+    before = time_calls(one_at_a_time, [points] * 100)
+    after = time_calls(batched, [points] * 100)
+
+    print("spatial (%d queries of 22 players, per cycle):" % queries)
+    print("  before: %8.2f us/cycle" % (before / 100 * 1e6))
+    print("  after:  %8.2f us/cycle" % (after / 100 * 1e6))
+    print("  speedup: %.2fx" % (before / after))
+
+def bench_subscribe(corpus):
+    """
+    Compares handling the handshake and player type messages, which a
+    subscribed handler only defers, against parsing and handling them all.
+    """
+
+    subscriptions = ("see", "sense_body", "hear")
+    msgs = [m for m in corpus
+            if message_parser.peek_head(m).decode() not in subscriptions]
+
+    everything = handler.MessageHandler(StoreOnlyWorldModel(None))
+    subscribed = handler.MessageHandler(StoreOnlyWorldModel(None),
+                                        subscriptions=subscriptions)
+
+    before = time_calls(everything.handle_message, msgs)
+    after = time_calls(subscribed.handle_message, msgs)
+
+    report("subscribe", before, after, len(msgs))
+
+def bench_dispatch(corpus):
+    """
+    Compares finding each parsed message's handler in the dispatch table
+    against building its '_handle_*' name and looking it up with hasattr and
+    getattr, as every message used to.
+    """
+
+    h = handler.MessageHandler(StoreOnlyWorldModel(None))
+    parsed = [message_parser.parse(m) for m in corpus]
+
+    def by_name(msg):
+        msg_func = "_handle_%s" % msg[0]
+        if hasattr(h, msg_func):
+            return getattr(h, msg_func)
+
+    def by_table(msg):
+        return h.handlers.get(msg[0])
+
+    before = time_calls(by_name, parsed, repeat=20)
+    after = time_calls(by_table, parsed, repeat=20)
+
+    report("dispatch", before, after, len(parsed))
+
+# all the available benchmarks, by the name used to run them
+BENCHMARKS = {
+    "cache": bench_cache,
+    "decode": bench_decode,
+    "dispatch": bench_dispatch,
+    "drain": bench_drain,
+    "filter": bench_filter,
+    "geometry": bench_geometry,
+    "history": bench_history,
+    "localize": bench_localize,
+    "localizers": bench_localizers,
+    "parse": bench_parse,
+    "recv": bench_recv,
+    "runtime": bench_runtime,
+    "see_alloc": bench_see_alloc,
+    "see_frame": bench_see_frame,
+    "send": bench_send,
+    "spatial": bench_spatial,
+    "subscribe": bench_subscribe,
+    "think": bench_think,
+}
+
+if __name__ == "__main__":
+    # run the named benchmarks, or all of them if none were given
+    names = sys.argv[1:2] if len(sys.argv) > 1 else sorted(BENCHMARKS)
+    if names and names[0] not in BENCHMARKS:
+        print("benchmarks:", ", ".join(sorted(BENCHMARKS)))
+        sys.exit(1)
+
+    corpus = load_corpus(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CORPUS)
+    for name in names:
+        BENCHMARKS[name](corpus)
@@ -0,0 +1,94 @@
+import functools
+
+class CycleCache:
+    """
+    Remembers values derived from the world model until it next changes,
+    which is at most once a cycle.  Counts how often a remembered value was
+    reused (a hit) and how often one had to be worked out (a miss).
+
+    Values may be worked out on one thread, like an agent's think loop, while
+    another updates the world model.  Every change starts a new generation
+    with its own dict of values, and a value is only ever stored in the dict
+    of the generation it started being worked out in, so one worked out from
+    a mix of old and new state is never found.
+
+    At most LIMIT values are remembered per generation; calls past that are
+    worked out every time, so that callers asking about ever new arguments
+    can't grow the cache without bound.
+    """
+
+    # the most values remembered in one generation
+    LIMIT = 1024
+
+    def __init__(self):
+        # whether values are remembered at all
+        self.enabled = True
+
+        # this generation's remembered values by (method name, arguments)
+        self.values = {}
+
+        # the number of times the world model has changed
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """
+        Forgets every remembered value and starts a new generation.  Called
+        whenever the world model's state changes, both before it's updated
+        and once it has been.
+        """
+
+        # replaced rather than cleared, so that a value still being worked
+        # out from the old state ends up in the old dict
+        self.generation += 1
+        self.values = {}
+
+    def reset_counters(self):
+        """
+        Sets the hit and miss counters back to zero.
+        """
+
+        self.hits = 0
+        self.misses = 0
+
+def cycle_cached(method):
+    """
+    Decorates a method of an object with a 'cycle_cache' attribute so that its
+    result is remembered in that CycleCache for the given arguments.  Calls
+    with arguments that can't be used as keys (ex: lists) aren't cached, nor
+    are calls once the cache holds CycleCache.LIMIT values.
+    """
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def cached(self, *args):
+        cache = self.cycle_cache
+        if not cache.enabled:
+            return method(self, *args)
+
+        # the generation's dict, taken before working anything out
+        values = cache.values
+        key = (name,) + args
+        try:
+            value = values[key]
+        except KeyError:
+            value = method(self, *args)
+            cache.misses += 1
+
+            # if the world model changed meanwhile, 'values' is an old
+            # generation's dict that's no longer looked in, so the value,
+            # maybe worked out from a mix of old and new state, is never found
+            if values is cache.values and len(values) < CycleCache.LIMIT:
+                values[key] = value
+
+            return value
+        except TypeError:
+            return method(self, *args)
+
+        cache.hits += 1
+        return value
+
+    return cached
@@ -1,4 +1,9 @@
 
+import re
+import threading
+
+import numpy as np
+
 class GameObject:
     """
     Root class for all percievable objects in the world model.
@@ -116,6 +121,21 @@ class Flag(GameObject):
             "c": (0, 0)
         }
 
+    # every flag id in a fixed order.  a flag's position in this list is its
+    # integer index, which is used to look up flags without any string work.
+    FLAG_IDS = list(FLAG_COORDS)
+
+    # maps every flag id to its integer index
+    FLAG_INDEX = dict(zip(FLAG_IDS, range(len(FLAG_IDS))))
+
+    # the (x, y) coordinates of every flag, as an array indexed by flag index
+    FLAG_COORDS_ARRAY = np.array(list(map(FLAG_COORDS.get, FLAG_IDS)),
+                                 dtype=float)
+
+    # maps the raw name of every flag in a see message, ex: b"f t r 10", to its
+    # integer index.  filled in below, once the class exists.
+    FLAG_NAME_INDEX = {}
+
     def __init__(self, distance, direction, flag_id):
         """
         Adds a flag id for this field object.  Every flag has a unique id.
@@ -125,6 +145,18 @@ class Flag(GameObject):
 
         GameObject.__init__(self, distance, direction)
 
+def flag_raw_name(flag_id):
+    """
+    Returns the name the server gives a flag in see messages, as raw bytes.
+    Ex: the name of flag "tr10" is b"f t r 10".
+    """
+
+    # every letter of the id is a separate token, but numbers are kept whole
+    return " ".join(["f"] + re.findall(r"[a-z]|\d+", flag_id)).encode()
+
+Flag.FLAG_NAME_INDEX.update((flag_raw_name(f), i)
+                            for f, i in Flag.FLAG_INDEX.items())
+
 class MobileObject(GameObject):
     """
     Represents objects that can move.
@@ -171,3 +203,261 @@ class Player(MobileObject):
         MobileObject.__init__(self, distance, direction, dist_change,
                 dir_change, speed)
 
+
+# compact variants of the classes above, which can be refilled with new values
+# through 'set' so that an ObjectPool can reuse them from one see message to
+# the next.  they're subclasses of the classes they mirror, so they work
+# anywhere those do, but keep their values in __slots__ instead of in the
+# per-instance __dict__.
+
+class CompactGameObject(GameObject):
+    """
+    A GameObject that can be refilled with new values.
+    """
+
+    __slots__ = ("distance", "direction")
+
+    def set(self, distance, direction):
+        """
+        Replaces all of this object's values, taking the same arguments as its
+        constructor.
+        """
+
+        self.distance = distance
+        self.direction = direction
+
+class CompactLine(Line):
+    __slots__ = ("distance", "direction", "line_id")
+
+    def set(self, distance, direction, line_id):
+        self.distance = distance
+        self.direction = direction
+        self.line_id = line_id
+
+class CompactGoal(Goal):
+    __slots__ = ("distance", "direction", "goal_id")
+
+    def set(self, distance, direction, goal_id):
+        self.distance = distance
+        self.direction = direction
+        self.goal_id = goal_id
+
+class CompactFlag(Flag):
+    __slots__ = ("distance", "direction", "flag_id")
+
+    def set(self, distance, direction, flag_id):
+        self.distance = distance
+        self.direction = direction
+        self.flag_id = flag_id
+
+class CompactMobileObject(MobileObject):
+    __slots__ = ("distance", "direction", "dist_change", "dir_change", "speed")
+
+    def set(self, distance, direction, dist_change, dir_change, speed):
+        self.distance = distance
+        self.direction = direction
+        self.dist_change = dist_change
+        self.dir_change = dir_change
+        self.speed = speed
+
+class CompactBall(Ball):
+    __slots__ = ("distance", "direction", "dist_change", "dir_change", "speed")
+
+    def set(self, distance, direction, dist_change, dir_change, speed):
+        self.distance = distance
+        self.direction = direction
+        self.dist_change = dist_change
+        self.dir_change = dir_change
+        self.speed = speed
+
+class CompactPlayer(Player):
+    __slots__ = ("distance", "direction", "dist_change", "dir_change", "speed",
+                 "team", "side", "uniform_number", "body_direction",
+                 "neck_direction")
+
+    def set(self, distance, direction, dist_change, dir_change, speed, team,
+            side, uniform_number, body_direction, neck_direction):
+        self.distance = distance
+        self.direction = direction
+        self.dist_change = dist_change
+        self.dir_change = dir_change
+        self.speed = speed
+        self.team = team
+        self.side = side
+        self.uniform_number = uniform_number
+        self.body_direction = body_direction
+        self.neck_direction = neck_direction
+
+class ReusePool:
+    """
+    Hands out reusable items, like the objects of a see message, in turn, so
+    that storing a new see message doesn't allocate anything.
+
+    A reader on another thread, like an agent's think loop, holds the pool
+    while it reads.  The last two items handed out, one of which is the one
+    the world model holds now, and every item handed out after them, are
+    then kept from being reused until the reader releases the pool.  If
+    every item is kept, a new one is made, so the pool grows to the most see
+    messages ever stored while it was held.
+    """
+
+    def __init__(self, factory, size):
+        self._factory = factory
+        self._items = [factory() for i in range(max(size, 2))]
+
+        # the indexes of the last two items handed out, last one last
+        self._recent = [0, 0]
+
+        # whether a reader holds the pool, and the indexes of the items it
+        # keeps from being reused.
+        self._holding = False
+        self._held = set()
+
+        # items are handed out and held from different threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def take(self):
+        """
+        Returns the oldest item that isn't held, or a new one if they all are.
+        Its contents are still those of the last time it was handed out.
+        """
+
+        with self._lock:
+            items = self._items
+            last = self._recent[1]
+
+            # the last item handed out may still be in use, so it's never
+            # handed out twice in a row.
+            for i in range(1, len(items)):
+                index = (last + i) % len(items)
+                if index not in self._held:
+                    break
+            else:
+                items.append(self._factory())
+                index = len(items) - 1
+
+            self._recent = [last, index]
+            if self._holding:
+                self._held.add(index)
+
+            return items[index]
+
+    def hold(self):
+        """
+        Keeps the items that may be read from being reused, until release is
+        called.
+        """
+
+        with self._lock:
+            self._holding = True
+            self._held.update(self._recent)
+
+    def release(self):
+        """
+        Lets every item be reused again.
+        """
+
+        with self._lock:
+            self._holding = False
+            self._held.clear()
+
+class ObjectStock:
+    """
+    The reusable instances of one compact class within an ObjectPool cycle.
+    """
+
+    __slots__ = ("object_class", "objects", "count")
+
+    def __init__(self, object_class):
+        self.object_class = object_class
+
+        # every instance made so far, and how many are in use this cycle
+        self.objects = []
+        self.count = 0
+
+    def take(self, *values):
+        """
+        Returns the next unused instance, filled with the given constructor
+        arguments, making a new one only if every instance is in use.
+        """
+
+        i = self.count
+        self.count = i + 1
+
+        if i < len(self.objects):
+            obj = self.objects[i]
+            obj.set(*values)
+            return obj
+
+        obj = self.object_class(*values)
+        self.objects.append(obj)
+        return obj
+
+class ObjectPoolCycle:
+    """
+    Everything an ObjectPool hands out for a single see message: a stock of
+    each kind of compact object, and the lists the objects are stored in.
+    """
+
+    __slots__ = ("flag", "goal", "line", "ball", "player",
+                 "flags", "goals", "lines", "players")
+
+    def __init__(self):
+        self.flag = ObjectStock(CompactFlag)
+        self.goal = ObjectStock(CompactGoal)
+        self.line = ObjectStock(CompactLine)
+        self.ball = ObjectStock(CompactBall)
+        self.player = ObjectStock(CompactPlayer)
+
+        self.flags = []
+        self.goals = []
+        self.lines = []
+        self.players = []
+
+    def reset(self):
+        """
+        Marks every instance as unused and empties the lists.
+        """
+
+        self.flag.count = 0
+        self.goal.count = 0
+        self.line.count = 0
+        self.ball.count = 0
+        self.player.count = 0
+
+        # cleared in place, so that the lists keep their allocated space
+        del self.flags[:]
+        del self.goals[:]
+        del self.lines[:]
+        del self.players[:]
+
+class ObjectPool(ReusePool):
+    """
+    Hands out compact game objects for see messages, reusing the instances
+    (and lists) of an earlier see message instead of allocating new ones.
+
+    Cycles are reused like any ReusePool's items, so the objects of the last
+    see message stay valid while the next one is stored, and those of the see
+    messages stored while the pool is held stay valid until it's released.
+    Anything that needs an object for longer than that must copy its values.
+    """
+
+    # the number of see messages' worth of objects kept to begin with
+    CYCLES = 3
+
+    def __init__(self, cycles=CYCLES):
+        ReusePool.__init__(self, ObjectPoolCycle, cycles)
+
+    def next_cycle(self):
+        """
+        Returns the ObjectPoolCycle to fill for a new see message, emptied of
+        whatever it held before.
+        """
+
+        cycle = self.take()
+        cycle.reset()
+
+        return cycle
@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+
+# the play boundaries, a little outside the field lines.  positions outside
+# them can't be right.
+MAX_X = 60
+MAX_Y = 40
+
+# missing values are NaN in arrays.  NaN goes through arithmetic unharmed, so
+# a missing input gives a missing output without any special cases, and
+# comparisons with it are always false, so a missing point is never in the
+# field or within any distance.
+
+def as_points(points):
+    """
+    Returns the given (x, y) point or sequence of points as an (n, 2) array of
+    floats, with None coordinates made NaN.
+    """
+
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+def as_values(values):
+    """
+    Returns the given number or sequence of numbers as an array of floats,
+    with None values made NaN.
+    """
+
+    return np.asarray(values, dtype=float).reshape(-1)
+
+def is_missing(point):
+    """
+    Returns whether a single (x, y) point is missing or has a missing
+    coordinate.
+    """
+
+    if point is None or point[0] is None or point[1] is None:
+        return True
+
+    return math.isnan(point[0]) or math.isnan(point[1])
+
+def missing(points):
+    """
+    Returns which rows of an (n, 2) array of points have a missing coordinate.
+    """
+
+    return np.isnan(points).any(axis=1)
+
+def with_default(values, default):
+    """
+    Returns the given array with its missing values replaced by 'default'.
+    """
+
+    return np.where(np.isnan(values), default, values)
+
+def normalize_angle(angles):
+    """
+    Returns the given angles in degrees, as a number or an array, turned into
+    the same angles in [-180, 180).
+    """
+
+    return (angles + 180) % 360 - 180
+
+def polar_to_cartesian(origin, heading, distances, directions):
+    """
+    Returns the absolute positions, as an (n, 2) array, of objects seen at the
+    given distances and directions by a player at 'origin' facing the absolute
+    angle 'heading'.  Like all relative directions the server sends, the
+    directions are measured the opposite way from our absolute angles.  Rows
+    with a missing distance or direction are NaN.
+    """
+
+    angles = np.radians(heading - as_values(directions))
+    distances = as_values(distances)
+
+    return np.column_stack((origin[0] + distances * np.cos(angles),
+                            origin[1] + distances * np.sin(angles)))
+
+def polar_to_point(origin, heading, distance, direction):
+    """
+    Does the same as polar_to_cartesian for a single object, returning an
+    (x, y) tuple, or None if anything needed is missing.
+    """
+
+    if (is_missing(origin) or heading is None or distance is None or
+            direction is None):
+        return None
+
+    angle = math.radians(heading - direction)
+    return (origin[0] + distance * math.cos(angle),
+            origin[1] + distance * math.sin(angle))
+
+def distance_matrix(points, others):
+    """
+    Returns the distance from every one of the given (m, 2) points to every
+    one of the (n, 2) others, as an (m, n) array.
+    """
+
+    deltas = points[:, np.newaxis, :] - others[np.newaxis, :, :]
+    return np.sqrt((deltas ** 2).sum(axis=2))
+
+def distances(points, point):
+    """
+    Returns the distance from every one of the given (n, 2) points to a
+    single (x, y) point.
+    """
+
+    return np.hypot(points[:, 0] - point[0], points[:, 1] - point[1])
+
+def distance(point1, point2):
+    """
+    Returns the distance between two (x, y) points, or NaN if either is
+    missing.
+    """
+
+    if is_missing(point1) or is_missing(point2):
+        return math.nan
+
+    dx = point1[0] - point2[0]
+    dy = point1[1] - point2[1]
+
+    return math.sqrt(dx ** 2 + dy ** 2)
+
+def bearings(origin, points):
+    """
+    Returns the absolute angle in degrees, in [0, 360), from 'origin' to every
+    one of the given (n, 2) points, with the positive x-axis at 0 degrees and
+    the positive y-axis at 90.
+    """
+
+    angles = np.degrees(np.arctan2(points[:, 1] - origin[1],
+                                   points[:, 0] - origin[0]))
+    return angles % 360
+
+def bearing(point1, point2):
+    """
+    Returns the absolute angle in degrees, in [0, 360), from one (x, y) point
+    to another, or NaN if either is missing.
+    """
+
+    if is_missing(point1) or is_missing(point2):
+        return math.nan
+
+    a = math.degrees(math.atan2(point2[1] - point1[1], point2[0] - point1[0]))
+    if a < 0:
+        a = 360 + a
+
+    return a
+
+def in_field(points, max_x=MAX_X, max_y=MAX_Y):
+    """
+    Returns which of the given (n, 2) points are within the play boundaries.
+    Missing points never are.
+    """
+
+    return (np.abs(points[:, 0]) <= max_x) & (np.abs(points[:, 1]) <= max_y)
+
+def clip_to_field(point, max_x=MAX_X, max_y=MAX_Y):
+    """
+    Returns the nearest (x, y) point to the given one that's within the play
+    boundaries.
+    """
+
+    return (min(max(float(point[0]), -max_x), max_x),
+            min(max(float(point[1]), -max_y), max_y))
@@ -1,9 +1,13 @@
 import collections
 import queue
+import sys
+
+import numpy as np
 
 from . import message_parser
 from . import sp_exceptions
 from . import game_object
+from .see_frame import SeeFrame, PlayerTable, NAN
 from .world_model import WorldModel
 
 # should we print messages received from the server?
@@ -19,15 +23,169 @@ class MessageHandler:
 
     All '_handle_*' functions deal with their appropriate message types
     as received from a server.  This allows adding a message handler to be as
-    simple as adding a new '_handle_*' function to this object.
+    simple as adding a new '_handle_*' function to this object.  They're
+    collected into a dispatch table when the object is created, and plugins can
+    add to it at any time through register_handler.
     """
 
     # an inner class used for creating named tuple 'hear' messages
     Message = collections.namedtuple("Message", "time sender message")
 
-    def __init__(self, world_model):
+    # maps the name of each sense_body value to the world model attributes its
+    # values are stored in, in order.  the message's own name is mapped to
+    # where its time goes.
+    BODY_ATTRIBUTES = {
+        b"sense_body": ("body_time",),
+        b"view_mode": ("view_quality", "view_width"),
+        b"stamina": ("stamina", "effort"),
+        b"speed": ("speed_amount", "speed_direction"),
+        b"head_angle": ("neck_direction",),
+        b"kick": ("kick_count",),
+        b"dash": ("dash_count",),
+        b"turn": ("turn_count",),
+        b"say": ("say_count",),
+        b"turn_neck": ("turn_neck_count",),
+        b"catch": ("catch_count",),
+        b"move": ("move_count",),
+        b"change_view": ("change_view_count",),
+    }
+
+    # the number of values captured from each of those lists.  any more that
+    # newer servers send, like the capacity after stamina and effort, aren't.
+    BODY_VALUE_COUNTS = dict((name, len(attrs))
+                             for name, attrs in BODY_ATTRIBUTES.items())
+
+    # message types that are always handled, whatever the subscriptions.  the
+    # server parameters are sent once, at the start, and the trackers and
+    # possession checks depend on them.  the player parameters are sent once
+    # too.  nothing here reads them yet, but a handler registered for them, or
+    # a subclass's '_handle_player_param', must not miss them.
+    ESSENTIAL_TYPES = frozenset([b"init", b"error", b"warning",
+                                 b"server_param", b"player_param"])
+
+    # the number of unhandled messages of each type kept for later parsing
+    DEFERRED_LIMIT = 32
+
+    def __init__(self, world_model, subscriptions=None, defer=True):
+        """
+        'subscriptions' is an iterable of the message types (ex: "see") that
+        should be parsed and stored in the world model, or None to handle all
+        of them.  Only the head of every other message is read.  If 'defer' is
+        True, these are kept in 'deferred' as LazyMessage objects that parse
+        themselves when first needed, otherwise they're simply dropped.
+        """
+
         self.wm = world_model
 
+        # the function that handles each type of parsed message, by its type.
+        # these are all the '_handle_*' functions of this object, found once
+        # here instead of by name for every message.
+        self.handlers = {}
+        for attr in dir(self):
+            if attr.startswith("_handle_"):
+                self.handlers[sys.intern(attr[len("_handle_"):])] = getattr(self, attr)
+
+        # the heads of the message types we handle, None if we handle them all
+        self.subscriptions = None
+        if subscriptions is not None:
+            self.subscribe(*subscriptions)
+
+        # the most recent unhandled messages, as deques of LazyMessage objects
+        # by message type.
+        self.defer = defer
+        self.deferred = {}
+
+        # decoders that turn raw messages of the most frequent types straight
+        # into world model data, by message head.  all other messages go
+        # through the generic parser and their '_handle_*' function.  the
+        # decoders do the same as the '_handle_*' functions they stand in
+        # for, so one is only used if a subclass doesn't override its
+        # function.
+        self.decoders = {}
+        for head, decoder in ((b"see", self._decode_see),
+                              (b"sense_body", self._decode_sense_body),
+                              (b"hear", self._decode_hear)):
+            name = "_handle_" + head.decode()
+            if getattr(type(self), name) is getattr(MessageHandler, name):
+                self.decoders[head] = decoder
+
+        # whether see messages are stored as SeeFrame arrays, from the world
+        # model's frame pool, instead of as lists of GameObjects.  this is
+        # the fastest way to store them, but off by default for the same
+        # reason as 'pool_objects': the world model's objects become views
+        # of a frame that a later see message refills (see ObjectView).
+        self.see_frames = False
+
+        # whether see messages that aren't stored as frames use compact
+        # objects from the world model's ObjectPool instead of new
+        # GameObjects.  off by default, since pooled objects are refilled
+        # with a later see message's data, so code that keeps one for more
+        # than a cycle must copy it instead (see ObjectPool).
+        self.pool_objects = False
+
+        # the compiled layout of sense_body messages, and the world model
+        # attribute each of its captured values is stored in.
+        self._body_template = None
+        self._body_template_attrs = []
+
+        # the list names (see message_parser.list_names) of sense_body layouts
+        # that couldn't be compiled, so that they aren't tried again.
+        self._untemplated_layouts = set()
+
+        # the number of see messages skipped by handle_messages because a
+        # newer one came in with them.
+        self.dropped_sees = 0
+
+    def register_handler(self, msg_type, func):
+        """
+        Registers a function that takes parsed messages of the given type (ex:
+        "see") and stores their data, replacing any existing handler for that
+        type.  Passing None removes the handler for that type.  Any decoder
+        for that type is removed too, so that messages of the type go through
+        the generic parser and reach the new handler.
+        """
+
+        if isinstance(msg_type, bytes):
+            msg_type = msg_type.decode()
+        msg_type = sys.intern(msg_type)
+
+        self.decoders.pop(msg_type.encode(), None)
+
+        if func is None:
+            self.handlers.pop(msg_type, None)
+        else:
+            self.handlers[msg_type] = func
+
+    def register_decoder(self, head, decoder):
+        """
+        Registers a function that takes raw messages with the given head (ex:
+        "see") and stores their data directly, bypassing the generic parser.
+        Passing None removes the decoder for that head.
+        """
+
+        if isinstance(head, str):
+            head = head.encode()
+
+        if decoder is None:
+            self.decoders.pop(head, None)
+        else:
+            self.decoders[head] = decoder
+
+    def subscribe(self, *heads):
+        """
+        Limits the message types that get handled to the given ones, in
+        addition to any already subscribed to.  Messages of other types, except
+        for the essential ones, are deferred or dropped without being parsed.
+        """
+
+        if self.subscriptions is None:
+            self.subscriptions = set(self.ESSENTIAL_TYPES)
+
+        for head in heads:
+            if isinstance(head, str):
+                head = head.encode()
+            self.subscriptions.add(head)
+
     def handle_message(self, msg):
         """
         Takes a raw message direct from the server, parses it, and stores its
@@ -35,25 +193,83 @@ class MessageHandler:
         type of message received.
         """
 
+        head = message_parser.peek_head(msg)
+
+        # skip messages we're not subscribed to without parsing them
+        if self.subscriptions is not None and head not in self.subscriptions:
+            msg_type = head.decode()
+            if self.defer:
+                lazy = message_parser.LazyMessage(msg)
+                deferred = self.deferred.get(msg_type)
+                if deferred is None:
+                    deferred = self.deferred[msg_type] = collections.deque(
+                        maxlen=self.DEFERRED_LIMIT)
+                deferred.append(lazy)
+
+            return msg_type
+
+        # decode the message directly if we know how to
+        decoder = self.decoders.get(head)
+        if decoder is not None:
+            if PRINT_SERVER_MESSAGES:
+                print(bytes(msg).decode(), "\n")
+
+            decoder(msg)
+            return head.decode()
+
         # get all the expressions contained in the given message
-        parsed = message_parser.parse(msg)
+        return self.handle_parsed(message_parser.parse(msg))
+
+    def handle_messages(self, msgs, drop_stale_sees=False):
+        """
+        Handles every one of the given raw messages in order, like
+        handle_message, and returns a list of their types.  If
+        'drop_stale_sees' is True, only the last see message is handled, since
+        it replaces everything the others would have told us.  The skipped
+        ones are counted in 'dropped_sees', so that an agent falling behind
+        the server can tell.
+        """
+
+        # the index of the only see message to handle, if any are skipped
+        last_see = None
+        if drop_stale_sees:
+            for i in range(len(msgs) - 1, -1, -1):
+                if message_parser.peek_head(msgs[i]) == b"see":
+                    last_see = i
+                    break
+
+        types = []
+        for i, msg in enumerate(msgs):
+            if (last_see is not None and i < last_see and
+                    message_parser.peek_head(msg) == b"see"):
+                self.dropped_sees += 1
+                continue
+
+            types.append(self.handle_message(msg))
+
+        return types
+
+    def handle_parsed(self, parsed):
+        """
+        Stores the data of an already parsed message in the world and body
+        model objects given at init.  Returns the type of message received.
+        """
 
         if PRINT_SERVER_MESSAGES:
             print(parsed[0] + ":", parsed[1:], "\n")
 
-        # this is the name of the function that should be used to handle
-        # this message type.  we pull it from this object dynamically to
-        # avoid having a huge if/elif/.../else statement.
-        msg_func = "_handle_%s" % parsed[0]
-
-        if hasattr(self, msg_func):
-            # call the appropriate function with this message
-            getattr(self, msg_func).__call__(parsed)
+        # look up the function that should be used to handle this message
+        # type, to avoid having a huge if/elif/.../else statement.
+        msg_func = self.handlers.get(parsed[0])
 
         # throw an exception if we don't know about the given message type
-        else:
+        if msg_func is None:
             m = "Can't handle message type '%s', function '%s' not found."
-            raise sp_exceptions.MessageTypeError(m % (parsed[0], msg_func))
+            raise sp_exceptions.MessageTypeError(m % (parsed[0],
+                                                      "_handle_%s" % parsed[0]))
+
+        # call the appropriate function with this message
+        msg_func(parsed)
 
         # return the type of message received
         return parsed[0]
@@ -70,7 +286,6 @@ class MessageHandler:
         """
 
         # the simulation cycle of the soccer server
-        # TODO: we should probably use this somewhere...
         sim_time = msg[1]
 
         # store new values before changing those in the world model.  all new
@@ -144,17 +359,7 @@ class MessageHandler:
                     position = name[3]
 
                 # figure out the player's side
-                side = None
-                if teamname is not None:
-                    # if they're on our team, they're on our side
-                    if teamname == self.wm.teamname:
-                        side = self.wm.side
-                    # otherwise, set side to the other team's side
-                    else:
-                        if self.wm.side == WorldModel.SIDE_L:
-                            side = WorldModel.SIDE_R
-                        else:
-                            side = WorldModel.SIDE_L
+                side = self._player_side(teamname)
 
                 # calculate player's speed
                 speed = None
@@ -184,7 +389,9 @@ class MessageHandler:
 
             # parse the ball
             elif name[0] == 'b':
-                # TODO: handle speed!
+                # a single see message can't tell us the ball's speed.  the
+                # world model's ball_tracker works out its absolute velocity
+                # from this and earlier see messages.
                 new_ball = game_object.Ball(distance, direction, dist_change,
                                             dir_change, None)
 
@@ -209,22 +416,397 @@ class MessageHandler:
 
             # an unhandled object type
             else:
-                raise ObjectTypeError("Unknown object: '" + str(obj) + "'")
+                raise sp_exceptions.ObjectTypeError("Unknown object: '" +
+                                                    str(obj) + "'")
 
         # tell the WorldModel to update any internal variables based on the
         # newly gleaned information.
+        self.wm.sim_time = sim_time
         self.wm.process_new_info(new_ball, new_flags, new_goals, new_players,
                                  new_lines)
 
+    def _decode_see(self, msg):
+        """
+        Stores a raw see message in the world model, as a SeeFrame if
+        'see_frames' is set, otherwise as GameObjects.
+        """
+
+        if self.see_frames:
+            self._decode_see_frame(msg)
+        else:
+            self._decode_see_objects(msg)
+
+    def _decode_see_frame(self, msg):
+        """
+        Turns a raw see message directly into the columns of the next SeeFrame
+        from the world model's frame pool, without building the generic nested
+        lists, any GameObjects, or any per-object lists of values.  Each value
+        token is converted and written straight into its column.  The world
+        model gets views of the frame in place of GameObjects.
+
+        Flags, goals, and lines only ever have a distance and a direction, so
+        only those two columns are written for them, the others stay NaN.
+        Players and the ball get full rows of six values.
+        """
+
+        frame = self.wm.frame_pool.take()
+        flags = frame.flag_table
+        goals = frame.goal_table
+        lines = frame.line_table
+        players = frame.player_table
+        ball = frame.ball_table
+
+        atom = message_parser.atom
+        flag_name_index = game_object.Flag.FLAG_NAME_INDEX
+        goal_name_index = SeeFrame.GOAL_NAME_INDEX
+        line_name_index = SeeFrame.LINE_NAME_INDEX
+
+        parts = bytes(msg).split(b"((")
+        frame.time = atom(parts[0].split()[1]) if b" " in parts[0] else None
+
+        # make sure no table has to grow while it's being written, then get
+        # its columns, which reserving may have replaced.
+        frame.reserve(len(parts) - 1)
+        player_values = players.flat_values
+        player_ids = players.flat_ids
+        player_teams = players.flat_teams
+        player_sides = players.flat_sides
+        ball_values = ball.flat_values
+
+        # the number of rows written to each table so far
+        counts = {b"f": 0, b"g": 0, b"l": 0}
+        player_count = 0
+        ball_count = 0
+
+        # the values and ids columns, and the ids, of flags, goals, and lines,
+        # by the kind of object in the message.
+        landmarks = {
+            b"f": (flags.flat_values, flags.flat_ids, flag_name_index),
+            b"g": (goals.flat_values, goals.flat_ids, goal_name_index),
+            b"l": (lines.flat_values, lines.flat_ids, line_name_index),
+        }
+
+        for obj in parts[1:]:
+            name, _, values = obj.partition(b")")
+            tokens = values.rstrip(b") \0\r\n").split()
+            count = len(tokens)
+
+            kind = name[:1]
+
+            # see _handle_see for what the different numbers of values mean
+            if kind == b"f" or kind == b"l" or kind == b"g":
+                columns, ids, name_index = landmarks[kind]
+                row = counts[kind]
+                counts[kind] = row + 1
+
+                ids[row] = name_index.get(name, -1)
+                base = 6 * row
+                if count >= 2:
+                    columns[base] = float(tokens[0])
+                    columns[base + 1] = float(tokens[1])
+                elif count == 1:
+                    columns[base] = NAN
+                    columns[base + 1] = float(tokens[0])
+                else:
+                    columns[base] = NAN
+                    columns[base + 1] = NAN
+
+                continue
+
+            if kind == b"F" or kind == b"G":
+                kind = kind.lower()
+                columns, ids, name_index = landmarks[kind]
+                row = counts[kind]
+                counts[kind] = row + 1
+
+                ids[row] = -1
+                columns[6 * row] = NAN
+                columns[6 * row + 1] = NAN
+
+                continue
+
+            if kind == b"p" or kind == b"P":
+                teamname = None
+                uniform_number = -1
+
+                name_parts = name.split()
+                if len(name_parts) >= 2:
+                    teamname = name_parts[1].strip(b'"').decode()
+                if len(name_parts) >= 3:
+                    uniform_number = atom(name_parts[2])
+
+                side = self._player_side(teamname)
+
+                player_ids[player_count] = uniform_number
+                player_teams[player_count] = players.team_index(teamname)
+                player_sides[player_count] = (PlayerTable.SIDES.index(side)
+                                              if side is not None else -1)
+
+                columns = player_values
+                base = 6 * player_count
+                player_count += 1
+
+            elif kind == b"b" or kind == b"B":
+                # only the last ball seen is kept
+                columns = ball_values
+                base = 0
+                ball_count = 1
+
+            else:
+                raise sp_exceptions.ObjectTypeError("Unknown object: '" +
+                                                    obj.decode() + "'")
+
+            # the values of mobile objects fill out distance, direction,
+            # dist_change, dir_change, body_dir, and neck_dir in order, except
+            # that a lone value is the direction, and an odd last one isn't
+            # used.  the rest are missing.
+            first = 0
+            if kind == b"P" or kind == b"B":
+                used = 0
+            elif count == 1:
+                first = 1
+                used = 1
+            else:
+                used = min(count - count % 2, 6)
+
+            for i in range(first):
+                columns[base + i] = NAN
+            for i in range(used):
+                columns[base + first + i] = float(tokens[i])
+            for i in range(first + used, 6):
+                columns[base + i] = NAN
+
+        flags.count = counts[b"f"]
+        goals.count = counts[b"g"]
+        lines.count = counts[b"l"]
+        players.count = player_count
+        ball.count = ball_count
+
+        self.wm.see_frame = frame
+        self.wm.sim_time = frame.time
+        self.wm.process_new_info(frame.ball, frame.flags, frame.goals,
+                                 frame.players, frame.lines,
+                                 frame.flag_arrays())
+
+    def _decode_see_objects(self, msg):
+        """
+        Turns a raw see message directly into game objects, without building
+        the generic nested lists first.  Produces the same objects as
+        _handle_see.
+
+        Every object in a see message starts with a '((', so splitting on that
+        gives us each object's name followed by its values, ex: "f c) 58 32) ".
+        """
+
+        new_ball = None
+
+        # take the objects and their lists from the world model's pool, or
+        # make new ones.
+        if self.pool_objects:
+            cycle = self.wm.object_pool.next_cycle()
+            new_flags = cycle.flags
+            new_goals = cycle.goals
+            new_lines = cycle.lines
+            new_players = cycle.players
+
+            make_flag = cycle.flag.take
+            make_goal = cycle.goal.take
+            make_line = cycle.line.take
+            make_ball = cycle.ball.take
+            make_player = cycle.player.take
+        else:
+            new_flags = []
+            new_goals = []
+            new_lines = []
+            new_players = []
+
+            make_flag = game_object.Flag
+            make_goal = game_object.Goal
+            make_line = game_object.Line
+            make_ball = game_object.Ball
+            make_player = game_object.Player
+
+        # the visible flags as integer indexes, distances, and directions
+        flag_indexes = []
+        flag_distances = []
+        flag_directions = []
+
+        atom = message_parser.atom
+        flag_name_index = game_object.Flag.FLAG_NAME_INDEX
+        flag_ids = game_object.Flag.FLAG_IDS
+
+        # the first part is the head and simulation cycle
+        parts = bytes(msg).split(b"((")
+        head = parts[0].split()
+        sim_time = atom(head[1]) if len(head) > 1 else None
+
+        for obj in parts[1:]:
+            name, _, values = obj.partition(b")")
+            members = [atom(v) for v in values.rstrip(b") \0\r\n").split()]
+
+            # default values for object data
+            distance = None
+            direction = None
+            dist_change = None
+            dir_change = None
+            body_dir = None
+            neck_dir = None
+
+            # see _handle_see for what the different numbers of values mean
+            count = len(members)
+            if count == 1:
+                direction = members[0]
+            elif count >= 2:
+                distance = members[0]
+                direction = members[1]
+
+                if count >= 4:
+                    dist_change = members[2]
+                    dir_change = members[3]
+
+                if count >= 6:
+                    body_dir = members[4]
+                    neck_dir = members[5]
+
+            kind = name[:1]
+
+            # flags are the most common object, so they come first
+            if kind == b"f":
+                index = flag_name_index.get(name)
+                if index is not None:
+                    flag_id = flag_ids[index]
+
+                    flag_indexes.append(index)
+                    flag_distances.append(distance)
+                    flag_directions.append(direction)
+                else:
+                    flag_id = b"".join(name.split()[1:]).decode()
+
+                new_flags.append(make_flag(distance, direction, flag_id))
+
+            elif kind == b"p":
+                teamname = None
+                uniform_number = None
+
+                name_parts = name.split()
+                if len(name_parts) >= 2:
+                    teamname = name_parts[1].strip(b'"').decode()
+                if len(name_parts) >= 3:
+                    uniform_number = atom(name_parts[2])
+
+                side = self._player_side(teamname)
+
+                new_players.append(make_player(distance, direction,
+                                               dist_change, dir_change, None,
+                                               teamname, side, uniform_number,
+                                               body_dir, neck_dir))
+
+            elif kind == b"l":
+                line_id = None
+                if len(name) > 1:
+                    line_id = name.split()[1].decode()
+
+                new_lines.append(make_line(distance, direction, line_id))
+
+            elif kind == b"g":
+                goal_id = None
+                if len(name) > 1:
+                    goal_id = name.split()[1].decode()
+
+                new_goals.append(make_goal(distance, direction, goal_id))
+
+            elif kind == b"b":
+                # the speed is left to the world model's ball_tracker, like
+                # in _handle_see.
+                new_ball = make_ball(distance, direction, dist_change,
+                                     dir_change, None)
+
+            elif kind == b"B":
+                new_ball = make_ball(None, None, None, None, None)
+
+            elif kind == b"F":
+                new_flags.append(make_flag(None, None, None))
+
+            elif kind == b"G":
+                new_goals.append(make_goal(None, None, None))
+
+            elif kind == b"P":
+                new_players.append(make_player(None, None, None, None, None,
+                                               None, None, None, None, None))
+
+            else:
+                raise sp_exceptions.ObjectTypeError("Unknown object: '" +
+                                                    obj.decode() + "'")
+
+        flag_arrays = (np.array(flag_indexes, dtype=np.intp),
+                       np.array(flag_distances, dtype=float),
+                       np.array(flag_directions, dtype=float))
+
+        self.wm.sim_time = sim_time
+        self.wm.process_new_info(new_ball, new_flags, new_goals, new_players,
+                                 new_lines, flag_arrays)
+
+    def _player_side(self, teamname):
+        """
+        Returns the side of a player seen on the given team, or None if the
+        team is unknown.
+        """
+
+        if teamname is None:
+            return None
+
+        # if they're on our team, they're on our side
+        if teamname == self.wm.teamname:
+            return self.wm.side
+
+        # otherwise, they're on the other team's side
+        if self.wm.side == WorldModel.SIDE_L:
+            return WorldModel.SIDE_R
+
+        return WorldModel.SIDE_L
+
     def _handle_hear(self, msg):
         """
         Parses audible information and turns it into useful information.
         """
 
+        # ignore truncated messages, without a sender or a message string
+        if len(msg) < 4:
+            return
+
         time_recvd = msg[1]  # server cycle when message was heard
         sender = msg[2]  # name (or direction) of who sent the message
         message = msg[3]  # message string
 
+        self._hear(time_recvd, sender, message)
+
+    def _decode_hear(self, msg):
+        """
+        Handles raw hear messages from the referee and ourselves directly.
+        Messages from other players can contain arbitrary quoted text, so
+        they're left to the generic parser and _handle_hear.
+        """
+
+        fields = bytes(msg).strip(b" \0\r\n")[1:-1].split(b" ")
+
+        # ignore truncated messages, like _handle_hear
+        if len(fields) < 4:
+            return
+
+        sender = fields[2]
+
+        if len(fields) == 4 and (sender == b"referee" or sender == b"self"):
+            self._hear(message_parser.atom(fields[1]), sender.decode(),
+                       fields[3].decode())
+        else:
+            self._handle_hear(message_parser.parse(msg))
+
+    def _hear(self, time_recvd, sender, message):
+        """
+        Updates the world model with a message heard at the given time from the
+        given sender.
+        """
+
         # ignore messages sent by self (NOTE: would anybody really want these?)
         if sender == "self":
             return
@@ -281,6 +863,8 @@ class MessageHandler:
         Deals with the agent's body model information.
         """
 
+        self.wm.body_time = msg[1]
+
         # update the body model information when received. each piece of info is
         # a list with the first item as the name of the data, and the rest as
         # the values.
@@ -322,6 +906,59 @@ class MessageHandler:
             else:
                 pass
 
+        self.wm.process_sense_body()
+
+    def _decode_sense_body(self, msg):
+        """
+        Stores the values of a raw sense_body message directly in the world
+        model, without building the generic nested lists first.
+
+        Every sense_body message the server sends has the same layout, so the
+        layout of the first one is compiled into a template that reads all
+        the values of later ones in a single match.  Messages that don't fit
+        the template go through _handle_sense_body instead, and their layout
+        becomes the new template, unless it's one that couldn't be compiled
+        before.
+        """
+
+        template = self._body_template
+        if template is not None:
+            m = template.fullmatch(msg)
+            if m is not None:
+                wm = self.wm
+                atom = message_parser.atom
+                for attr, value in zip(self._body_template_attrs, m.groups()):
+                    setattr(wm, attr, atom(value))
+
+                wm.process_sense_body()
+                return
+
+        # the layout is new or has changed, so fall back to the generic path
+        self._handle_sense_body(message_parser.parse(msg))
+        self._learn_body_template(msg)
+
+    def _learn_body_template(self, msg):
+        """
+        Compiles the layout of the given raw sense_body message into the
+        template used by _decode_sense_body.  Layouts that can't be compiled
+        are remembered, and the last template is kept for them.
+        """
+
+        layout = message_parser.list_names(msg)
+        if layout in self._untemplated_layouts:
+            return
+
+        compiled = message_parser.compile_template(msg, self.BODY_VALUE_COUNTS)
+        if compiled is None:
+            self._untemplated_layouts.add(layout)
+            return
+
+        # the world model attribute each captured value is stored in
+        template, captured = compiled
+        self._body_template = template
+        self._body_template_attrs = [self.BODY_ATTRIBUTES[name][index]
+                                     for name, index in captured]
+
     def _handle_change_player_type(self, msg):
         """
         Handle player change messages.
@@ -427,6 +1064,10 @@ class ActionHandler:
     # a command for our queue containing an id and command text
     Command = collections.namedtuple("Command", "cmd_type text")
 
+    # whether a cycle's commands are sent together in a single message, which
+    # the server accepts, rather than in a message each.
+    batch_commands = True
+
     def __init__(self, server_socket):
         """
         Save the socket that connects us to the soccer server to allow us to
@@ -438,40 +1079,75 @@ class ActionHandler:
         # this contains all requested actions for the current and future cycles
         self.q = queue.Queue()
 
+        # the number of commands sent, of primary commands dropped because a
+        # later one replaced them, of sends to the socket (ie. sendto system
+        # calls), and of times send_commands was called, ie. cycles.
+        self.commands_sent = 0
+        self.commands_dropped = 0
+        self.syscalls = 0
+        self.cycles = 0
+
+        # the same counts for the last cycle only
+        self.cycle_sent = 0
+        self.cycle_dropped = 0
+        self.cycle_syscalls = 0
+
     def send_commands(self):
         """
-        Sends all the enqueued commands.
+        Sends all the enqueued commands, in a single message unless
+        batch_commands is off.  Only the most recent primary command is sent,
+        after all the others.
         """
 
         # we only send the most recent primary command
         primary_cmd = None
+        texts = []
+        dropped = 0
 
-        # dequeue all enqueued commands and send them
+        # dequeue all enqueued commands
         while True:
             try:
                 cmd = self.q.get_nowait()
             except queue.Empty:
                 break
 
-            # save the most recent primary command and send it at the very end
+            # save the most recent primary command to send at the very end
             if cmd.cmd_type == ActionHandler.CommandType.TYPE_PRIMARY:
+                if primary_cmd is not None:
+                    dropped += 1
                 primary_cmd = cmd
-            # send other commands immediately
             else:
-                if PRINT_SENT_COMMANDS:
-                    print("sent:", cmd.text, "\n")
-
-                self.sock.send(cmd.text)
+                texts.append(cmd.text)
 
             # indicate that we finished processing a command
             self.q.task_done()
 
-        # send the saved primary command, if there was one
         if primary_cmd is not None:
-            if PRINT_SENT_COMMANDS:
-                print("sent:", primary_cmd.text, "\n")
-
-            self.sock.send(primary_cmd.text)
+            texts.append(primary_cmd.text)
+
+        if PRINT_SENT_COMMANDS:
+            for text in texts:
+                print("sent:", text, "\n")
+
+        # send everything at once, or each command on its own
+        syscalls = 0
+        if texts:
+            if self.batch_commands:
+                self.sock.send("".join(texts))
+                syscalls = 1
+            else:
+                for text in texts:
+                    self.sock.send(text)
+                syscalls = len(texts)
+
+        self.cycle_sent = len(texts)
+        self.cycle_dropped = dropped
+        self.cycle_syscalls = syscalls
+
+        self.commands_sent += len(texts)
+        self.commands_dropped += dropped
+        self.syscalls += syscalls
+        self.cycles += 1
 
     def move(self, x, y):
         """
@@ -0,0 +1,156 @@
+import numpy as np
+
+# the layout of the record kept for every cycle.  directions are absolute
+# and in degrees, like the world model's, except for the neck angle, which
+# is relative to the body.  unknown values are NaN, or -1 for numbers that
+# can't be NaN.
+RECORD = np.dtype([
+    # the simulation cycle of the record, and of the last see message
+    ("time", np.int32),
+    ("see_time", np.int32),
+
+    # our position and which ways our neck and body face
+    ("position", np.float64, 2),
+    ("neck_direction", np.float64),
+    ("body_direction", np.float64),
+
+    # the ball's position and velocity, as the ball tracker predicts them
+    ("ball_position", np.float64, 2),
+    ("ball_velocity", np.float64, 2),
+
+    # body state from the sense_body message
+    ("stamina", np.float64),
+    ("effort", np.float64),
+    ("speed_amount", np.float64),
+    ("speed_direction", np.float64),
+    ("neck_angle", np.float64),
+
+    # the play mode's number (see WorldModel.PLAY_MODE_NUMBERS) and the score
+    ("play_mode", np.int8),
+    ("score_l", np.int16),
+    ("score_r", np.int16),
+])
+
+class WorldHistory:
+    """
+    Keeps a record of the world model's state for each of the last 'depth'
+    cycles, in a structured array allocated up front.  Once it's full, every
+    new record replaces the oldest one, so keeping history costs the same
+    every cycle no matter how long the game has gone on.
+
+    Queries return the records, or fields of them, oldest first.
+    """
+
+    # the number of cycles kept by default
+    DEPTH = 300
+
+    def __init__(self, depth=DEPTH):
+        self.records = np.zeros(depth, dtype=RECORD)
+        self.depth = depth
+
+        # how many records have ever been added.  the next one goes in row
+        # 'count % depth'.
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.depth)
+
+    def append(self, values):
+        """
+        Adds a record for a new cycle, given as a tuple of values in the order
+        of the fields of RECORD.  Overwrites the oldest record if the history
+        is full.
+        """
+
+        self.records[self.count % self.depth] = values
+        self.count += 1
+
+    def _rows(self, n=None):
+        """
+        Returns the rows of the last 'n' records, or of all of them if 'n' is
+        None, oldest first.
+        """
+
+        size = len(self)
+        if n is None or n > size:
+            n = size
+
+        return np.arange(self.count - n, self.count) % self.depth
+
+    def last(self, n=None):
+        """
+        Returns a copy of the last 'n' records, or of all of them, oldest
+        first.
+        """
+
+        return self.records[self._rows(n)]
+
+    def latest(self):
+        """
+        Returns a copy of the most recent record, or None if there isn't one.
+        """
+
+        if self.count == 0:
+            return None
+
+        return self.records[(self.count - 1) % self.depth].copy()
+
+    def field(self, name, n=None):
+        """
+        Returns the values of one field of the last 'n' records, or of all of
+        them, oldest first.
+        """
+
+        return self.records[name][self._rows(n)]
+
+    def ball_positions(self, n=None):
+        """
+        Returns the ball's position in each of the last 'n' cycles, as an
+        (n, 2) array.
+        """
+
+        return self.field("ball_position", n)
+
+    def ball_speeds(self, n=None):
+        """
+        Returns the ball's speed in each of the last 'n' cycles.
+        """
+
+        velocities = self.field("ball_velocity", n)
+        return np.hypot(velocities[:, 0], velocities[:, 1])
+
+    def mean_speed(self, n=None):
+        """
+        Returns our mean speed over the last 'n' cycles, leaving out cycles
+        where it's unknown, or NaN if it's unknown in all of them.
+        """
+
+        return _mean_known(self.field("speed_amount", n))
+
+    def mean_ball_speed(self, n=None):
+        """
+        Returns the ball's mean speed over the last 'n' cycles, leaving out
+        cycles where it's unknown, or NaN if it's unknown in all of them.
+        """
+
+        return _mean_known(self.ball_speeds(n))
+
+    def since(self, time):
+        """
+        Returns a copy of the records from the given simulation cycle onwards,
+        oldest first.
+        """
+
+        records = self.last()
+        return records[records["time"] >= time]
+
+def _mean_known(values):
+    """
+    Returns the mean of the values that aren't NaN, or NaN if there are none.
+    """
+
+    known = values[~np.isnan(values)]
+    if len(known) == 0:
+        return np.nan
+
+    return float(known.mean())
@@ -0,0 +1,424 @@
+import math
+import os
+
+import numpy as np
+
+from . import geometry
+
+# the weights of flags are based on their distance, which is never taken to be
+# any less than this.  keeps very close flags from getting huge weights.
+MIN_WEIGHT_DISTANCE = 1.0
+
+# the play boundaries a position can be in, the same ones triangulate_position
+# uses.
+MAX_X = geometry.MAX_X
+MAX_Y = geometry.MAX_Y
+
+# flags spread out less than this fraction as much across their main
+# direction as along it are treated as being in a line.
+MIN_SPREAD_RATIO = 0.05
+
+def distance_weights(distances):
+    """
+    Returns the least-squares weight of each distance.  The server's distance
+    noise grows with distance, so a flag's weight is one over its squared
+    distance.
+    """
+
+    return 1.0 / np.maximum(distances, MIN_WEIGHT_DISTANCE) ** 2
+
+def linear_trilaterate(coords, distances, weights):
+    """
+    Returns a first estimate of the point at the given distances from the
+    given (n, 2) flag coordinates, by solving the linearized circle equations
+    with weighted least squares.
+
+    Subtracting the weighted mean of every circle's equation,
+    '|p|^2 - 2 p.c + |c|^2 = d^2', removes the '|p|^2' term and leaves a
+    linear system in p.  When all the flags lie on one line, that system only
+    fixes how far along the line the point is.  The point is then on one side
+    of the line or the other, and we pick the side that's within the play
+    boundaries, or the side nearer the center of the field if that doesn't
+    decide it.
+    """
+
+    total = weights.sum()
+    mean = weights.dot(coords) / total
+
+    centered = coords - mean
+    rhs = (coords ** 2).sum(axis=1) - distances ** 2
+    rhs -= weights.dot(rhs) / total
+
+    # the normal equations of the weighted system '2 (c - mean) . p = rhs'
+    weighted = centered * weights[:, np.newaxis]
+    normal = 2 * centered.T.dot(weighted)
+    target = rhs.dot(weighted)
+
+    # how spread out the flags are in their least and most spread out
+    # directions.  the normal matrix is symmetric, so eigh sorts these.
+    spread, directions = np.linalg.eigh(normal)
+    if spread[0] > MIN_SPREAD_RATIO ** 2 * spread[1]:
+        return solve2(normal, target)
+
+    # the flags are in a line.  find where along the line the point is, then
+    # how far from the line the distances put it.
+    along = directions[:, 1]
+    across = np.array([-along[1], along[0]])
+
+    positions = centered.dot(along)
+    scale = max(weights.dot(positions ** 2), 1e-12)
+    offset = weights.dot(positions * rhs) / (2 * scale)
+
+    heights = distances ** 2 - (offset - positions) ** 2
+    height = np.sqrt(max(weights.dot(heights) / total, 0.0))
+
+    base = mean + offset * along
+    first = base + height * across
+    second = base - height * across
+    inside = geometry.in_field(np.array((first, second)))
+    if inside[0] != inside[1]:
+        return first if inside[0] else second
+
+    if first.dot(first) <= second.dot(second):
+        return first
+
+    return second
+
+def solve2(matrix, vector):
+    """
+    Returns the solution of a 2x2 linear system, or None if it has no single
+    solution.  Much faster than numpy.linalg.solve for a single small system.
+    """
+
+    (a, b), (c, d) = matrix.tolist()
+    determinant = a * d - b * c
+    if abs(determinant) < 1e-12:
+        return None
+
+    x, y = vector.tolist()
+    return np.array([(d * x - b * y) / determinant,
+                     (a * y - c * x) / determinant])
+
+def inverse2(matrix):
+    """
+    Returns the inverse of a 2x2 matrix, or None if it has none.
+    """
+
+    (a, b), (c, d) = matrix.tolist()
+    determinant = a * d - b * c
+    if abs(determinant) < 1e-12:
+        return None
+
+    return np.array([[d, -b], [-c, a]]) / determinant
+
+def refine(point, coords, distances, weights, iterations=5):
+    """
+    Improves an estimate of the point at the given distances from the given
+    flag coordinates with a few Gauss-Newton steps on the weighted squared
+    distance errors.  Returns the refined point.
+    """
+
+    for i in range(iterations):
+        deltas = point - coords
+        ranges = np.sqrt((deltas ** 2).sum(axis=1))
+
+        # a point right on top of a flag has no direction to move in
+        ranges = np.maximum(ranges, 1e-9)
+
+        residuals = ranges - distances
+        jacobian = deltas / ranges[:, np.newaxis]
+
+        weighted = jacobian * weights[:, np.newaxis]
+        step = solve2(jacobian.T.dot(weighted), -residuals.dot(weighted))
+        if step is None:
+            break
+
+        point = point + step
+
+        if step.dot(step) < 1e-12:
+            break
+
+    return point
+
+def relative_errors(point, coords, distances):
+    """
+    Returns how far off every distance is for the given point, as a fraction
+    of the distance.
+    """
+
+    ranges = np.sqrt(((point - coords) ** 2).sum(axis=1))
+    return np.abs(ranges - distances) / np.maximum(distances,
+                                                    MIN_WEIGHT_DISTANCE)
+
+def trilaterate(coords, distances, outlier_ratio=0.15, min_flags=3):
+    """
+    Returns the (x, y) point best matching the given distances to the given
+    (n, 2) flag coordinates, or None if there are fewer than two flags.
+    Always gives the same result for the same input.
+
+    The point is found with weighted least squares.  If any flag's distance is
+    then off by more than 'outlier_ratio' of itself, the worst such flag is
+    dropped and the point found again, for as long as at least 'min_flags'
+    flags are left.  The point is kept within the play boundaries.
+    """
+
+    coords = np.asarray(coords, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+
+    # flags without a distance are no help
+    known = ~np.isnan(distances)
+    if not known.all():
+        coords = coords[known]
+        distances = distances[known]
+
+    if len(distances) < 2:
+        return None
+
+    while True:
+        weights = distance_weights(distances)
+        point = linear_trilaterate(coords, distances, weights)
+        point = refine(point, coords, distances, weights)
+
+        if len(distances) <= min_flags:
+            break
+
+        errors = relative_errors(point, coords, distances)
+        worst = errors.argmax()
+        if errors[worst] <= outlier_ratio:
+            break
+
+        coords = np.delete(coords, worst, axis=0)
+        distances = np.delete(distances, worst)
+
+    return geometry.clip_to_field(point)
+
+def heading(point, coords, directions):
+    """
+    Returns the absolute direction, in degrees in [0, 360), that the player at
+    the given point is facing, given the directions it sees flags at the
+    given (n, 2) coordinates in.  Returns None if the point is unknown or no
+    flag has a direction.
+
+    Every flag gives one estimate: its bearing from the point plus the
+    direction it's seen in.  The estimates are averaged as angles, by adding
+    them up as unit vectors, so that ex. 359 and 1 average to 0 and not 180.
+    """
+
+    if geometry.is_missing(point):
+        return None
+
+    known = ~np.isnan(directions)
+    if not known.all():
+        coords = coords[known]
+        directions = directions[known]
+
+    if len(directions) == 0:
+        return None
+
+    estimates = np.radians(geometry.bearings(point, coords) + directions)
+
+    mean = math.degrees(math.atan2(np.sin(estimates).sum(),
+                                   np.cos(estimates).sum()))
+    return mean % 360
+
+class DistanceGrid:
+    """
+    A table of the distance from every cell of a grid over the field to every
+    flag, for finding a position by looking up the cell whose distances best
+    match the seen ones.  The table only depends on the flags' coordinates,
+    so it's built once and can be shared, or memory-mapped from a file so
+    that every agent on a host shares the same pages.
+
+    The table has one row per flag and one column per cell, so the rows of the
+    visible flags can be taken together.  Cells are numbered row by row from
+    the bottom left corner of the play boundaries.
+    """
+
+    def __init__(self, coords, resolution=1.0, path=None):
+        """
+        Builds the grid for the given (n, 2) flag coordinates, with cells
+        'resolution' apart.  If 'path' is given, the table is memory-mapped
+        from that file, which is written first if it doesn't hold a table of
+        the right size.
+        """
+
+        self.resolution = resolution
+        self.xs = np.arange(-MAX_X, MAX_X + resolution / 2, resolution)
+        self.ys = np.arange(-MAX_Y, MAX_Y + resolution / 2, resolution)
+
+        shape = (len(coords), len(self.ys) * len(self.xs))
+
+        self.table = None
+        if path is not None and os.path.exists(path):
+            table = np.load(path, mmap_mode="r")
+            if table.shape == shape and table.dtype == np.float32:
+                self.table = table
+
+        if self.table is None:
+            self.table = self.build(coords)
+
+            if path is not None:
+                # write to a temporary file first, so that other agents never
+                # map a half-written table.
+                temp_path = "%s.%d.tmp" % (path, os.getpid())
+                with open(temp_path, "wb") as f:
+                    np.save(f, self.table)
+                os.replace(temp_path, path)
+
+                self.table = np.load(path, mmap_mode="r")
+
+    def build(self, coords):
+        """
+        Returns the table of distances from every cell to the given flags.
+        """
+
+        grid_x, grid_y = np.meshgrid(self.xs, self.ys)
+        cells = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+
+        coords = geometry.as_points(coords)
+        return geometry.distance_matrix(coords, cells).astype(np.float32)
+
+    def locate(self, flag_indexes, distances):
+        """
+        Returns the center of the cell whose distances to the flags with the
+        given indexes best match the given distances, weighted like
+        trilaterate, or None if fewer than two flags have a distance.  Takes
+        the same time no matter where the player is.
+        """
+
+        known = ~np.isnan(distances)
+        if not known.all():
+            flag_indexes = flag_indexes[known]
+            distances = distances[known]
+
+        if len(distances) < 2:
+            return None
+
+        # the weighted squared error of every cell, with every visible flag's
+        # row taken from the table at once.  everything is kept in single
+        # precision like the table, since mixing in doubles means copying it.
+        weights = distance_weights(distances).astype(np.float32)
+        deltas = self.table[flag_indexes]
+        deltas -= distances.astype(np.float32)[:, np.newaxis]
+        deltas *= deltas
+        errors = weights.dot(deltas)
+
+        row, column = divmod(int(errors.argmin()), len(self.xs))
+        return (float(self.xs[column]), float(self.ys[row]))
+
+# every grid built so far, by flag coordinates, resolution, and file, shared
+# by all world models in the process.
+_grids = {}
+
+def shared_grid(coords, resolution=1.0, path=None):
+    """
+    Returns the DistanceGrid for the given flag coordinates, resolution, and
+    file, building it only the first time it's asked for.
+    """
+
+    coords = np.asarray(coords, dtype=float)
+    key = (coords.tobytes(), resolution, path)
+    grid = _grids.get(key)
+    if grid is None:
+        grid = DistanceGrid(coords, resolution, path)
+        _grids[key] = grid
+
+    return grid
+
+class PositionFilter:
+    """
+    A Kalman filter that keeps track of the player's position from one cycle
+    to the next.  Every cycle, 'predict' moves the position by the player's
+    velocity from sense_body.  On every see, 'correct' pulls it toward the
+    seen flag distances with a single, cheap update instead of finding the
+    position from scratch.
+
+    When there's no position yet, or the seen flags no longer agree with the
+    predicted one, the position is found from scratch with 'trilaterate'.
+    """
+
+    # the standard deviation of seen distances, as a fraction of the distance
+    DISTANCE_NOISE = 0.05
+
+    # the variance added to the position every cycle, for movement that the
+    # seen velocity doesn't account for.
+    MOTION_VARIANCE = 0.05
+
+    # seen distances off from the predicted position by more than this
+    # fraction of themselves are left out of the update.
+    GATE_RATIO = 0.15
+
+    def __init__(self):
+        # the (x, y) position, as an array, and its 2x2 covariance.  None until
+        # the first see message.
+        self.position = None
+        self.covariance = None
+
+        # how many times the position was found from scratch
+        self.resets = 0
+
+    def predict(self, dx, dy):
+        """
+        Moves the position by the given amount, the distance the player moved
+        in one cycle, and makes it that much less certain.
+        """
+
+        if self.position is None:
+            return
+
+        self.position = self.position + (dx, dy)
+        self.covariance = self.covariance + np.eye(2) * self.MOTION_VARIANCE
+
+    def correct(self, coords, distances):
+        """
+        Updates the position with the distances to flags at the given (n, 2)
+        coordinates, and returns it as an (x, y) tuple, or None if it's still
+        unknown.
+        """
+
+        known = ~np.isnan(distances)
+        if not known.all():
+            coords = coords[known]
+            distances = distances[known]
+
+        if self.position is not None and len(distances) > 0:
+            deltas = self.position - coords
+            ranges = np.maximum(np.sqrt((deltas ** 2).sum(axis=1)), 1e-9)
+            residuals = distances - ranges
+
+            # only use the flags that agree with where we think we are
+            scales = np.maximum(distances, MIN_WEIGHT_DISTANCE)
+            agree = np.abs(residuals) <= self.GATE_RATIO * scales
+            noise = self.DISTANCE_NOISE * scales
+
+            if agree.sum() >= 2:
+                # the update in information form, so that only 2x2 matrices
+                # need to be inverted no matter how many flags are seen.
+                jacobian = (deltas / ranges[:, np.newaxis])[agree]
+                weighted = jacobian / (noise[agree] ** 2)[:, np.newaxis]
+
+                information = (inverse2(self.covariance) +
+                               jacobian.T.dot(weighted))
+                covariance = inverse2(information)
+                if covariance is not None:
+                    step = covariance.dot(residuals[agree].dot(weighted))
+
+                    self.covariance = covariance
+                    self.position = self.position + step
+
+                    return (float(self.position[0]), float(self.position[1]))
+
+        # the filter has nothing to go on, so start over from scratch
+        point = trilaterate(coords, distances)
+        if point is None:
+            if self.position is None:
+                return None
+
+            return (float(self.position[0]), float(self.position[1]))
+
+        self.resets += 1
+        self.position = np.array(point)
+        variance = (self.DISTANCE_NOISE * distances.mean()) ** 2
+        self.covariance = np.eye(2) * variance
+
+        return point
@@ -2,20 +2,613 @@
 
 import re
 
-# used to convert server value strings into actual python values
+# used to convert server value strings into actual python values by the
+# reference, character-at-a-time parser.
 pattern_int = re.compile(r"^-?\d+$")
 pattern_float = re.compile(r"^-?\d*[.]\d+$")
 
+# splits a message on its unescaped double quotes, so that parenthesis inside
+# strings can be protected before the message is tokenized.
+pattern_quote = re.compile(rb'(?<!\\)"')
+
+# matches the head of a message, the name following its first parenthesis
+pattern_head = re.compile(rb"[^(]*\(([^ ()\0\n\r\t]*)")
+
+# matches the name following every parenthesis in a message
+pattern_list_name = re.compile(rb"\(([^ ()\0\n\r\t]*)")
+
+# parenthesis found inside strings are swapped for these placeholder bytes
+# while tokenizing, then swapped back when the token is converted.
+_STR_OPEN = b"\x01"
+_STR_CLOSE = b"\x02"
+
+# caches the converted value of every atom token seen so far.  the server only
+# ever sends a small vocabulary of names and quantized numbers, so nearly every
+# token is a cache hit.  the cache is emptied once it grows past its limit.
+_atom_cache = {}
+_ATOM_CACHE_LIMIT = 65536
+
+def _convert_atom(tok):
+    """
+    Converts a single atom token (bytes) into an int, a float, or a string,
+    following the same rules as the reference parser's regular expressions but
+    without using them.
+    """
+
+    body = tok[1:] if tok[:1] == b"-" else tok
+
+    # an optionally negative run of digits is an int
+    if body.isdigit():
+        return int(tok)
+
+    # digits (possibly none), a single '.', then at least one digit is a float
+    head, dot, tail = body.partition(b".")
+    if dot and tail.isdigit() and (not head or head.isdigit()):
+        return float(tok)
+
+    # restore any parenthesis that were protected inside a string
+    if _STR_OPEN in tok or _STR_CLOSE in tok:
+        tok = tok.replace(_STR_OPEN, b"(").replace(_STR_CLOSE, b")")
+
+    return tok.decode()
+
+def atom(tok):
+    """
+    Converts a single raw atom token (bytes) into its int, float, or string
+    value, exactly as parse would, using the shared conversion cache.
+    """
+
+    try:
+        return _atom_cache[tok]
+    except KeyError:
+        if len(_atom_cache) >= _ATOM_CACHE_LIMIT:
+            _atom_cache.clear()
+
+        val = _atom_cache[tok] = _convert_atom(tok)
+        return val
+
+def peek_head(msg):
+    """
+    Returns the head of a raw message as bytes, ie. the name directly following
+    its opening parenthesis, without parsing the rest of it.  Ex: the head of
+    "(see 0 ((b) 1 2))" is b"see".
+    """
+
+    m = pattern_head.match(msg)
+    if m is None:
+        return b""
+
+    return m.group(1)
+
+def list_names(msg):
+    """
+    Returns the name of every list in a raw message, in order, as a tuple.
+    Messages with the same list names almost always share a layout, which
+    makes this a cheap key for remembering something about the layout.
+    """
+
+    return tuple(pattern_list_name.findall(msg))
+
+def compile_template(msg, names):
+    """
+    Learns the layout of a raw message, ie. its nesting and the name of every
+    list in it, and compiles a regular expression that matches any message
+    with the same layout but possibly different values.  Messages that always
+    share a layout, like sense_body, can then be read with a single match
+    instead of being parsed.
+
+    'names' maps the name of every list whose values are captured to the
+    number of its values that are, at most.  Only the top-level expression
+    and the lists directly inside it are captured from, and any values after
+    the first ones are matched without being captured, so that newer server
+    versions adding values to a list don't keep a template from being made.
+    Returns the compiled expression along with a list of (list name, value
+    index) tuples, one per captured group, in order.  Quoted strings aren't
+    supported in templates, so None is returned for messages containing them.
+    """
+
+    if b'"' in msg:
+        return None
+
+    msg = bytes(msg).strip(b" \0\r\n")
+
+    # the regular expression matching each token in turn, and whether the
+    # last token was an atom, which has to be separated from the next atom by
+    # at least one space.
+    pieces = []
+    prev_atom = False
+
+    # the name of the innermost open list, and the number of values seen in
+    # it so far, for every open list.
+    stack = []
+    captured = []
+
+    expect_name = False
+    for tok in _tokenize(msg):
+        if not tok:
+            continue
+
+        if tok == b"(":
+            pieces.append(rb" *\(")
+            stack.append([None, 0])
+            expect_name = True
+            prev_atom = False
+            continue
+
+        if tok == b")":
+            pieces.append(rb" *\)")
+            if not stack:
+                return None
+            stack.pop()
+            prev_atom = False
+            continue
+
+        pieces.append(rb" +" if prev_atom else rb" *")
+        prev_atom = True
+
+        # the first atom of a list is its name, which is part of the layout
+        if expect_name:
+            pieces.append(re.escape(tok))
+            stack[-1][0] = tok
+            expect_name = False
+
+        # every other atom is a value
+        else:
+            # an atom outside of any list belongs to no list, so it's never
+            # captured.
+            frame = stack[-1] if stack else None
+            if (frame is not None and len(stack) <= 2 and
+                    frame[1] < names.get(frame[0], 0)):
+                pieces.append(rb"([^ ()]+)")
+                captured.append((frame[0], frame[1]))
+            else:
+                pieces.append(rb"[^ ()]+")
+
+            if frame is not None:
+                frame[1] += 1
+
+    if stack:
+        return None
+
+    # the message may be followed by spaces and a null terminator
+    pattern = rb"".join(pieces) + rb"[ \0\r\n]*"
+    return re.compile(pattern), captured
+
+def _protect_strings(parts):
+    """
+    Joins the parts of a message that was split on its quotes back together
+    without the quotes, protecting the parenthesis inside every string.
+    """
+
+    # every odd part was inside a string
+    for i in range(1, len(parts), 2):
+        parts[i] = parts[i].replace(b"(", _STR_OPEN).replace(b")", _STR_CLOSE)
+
+    return b"".join(parts)
+
+def _tokenize(text, sep=b" "):
+    """
+    Splits a raw message into a list of tokens, where every parenthesis is its
+    own token and atoms are separated by 'sep' (any whitespace if None).
+    Quotes are removed, and parenthesis inside quoted strings are kept as part
+    of their atom.
+    """
+
+    if b'"' in text:
+        text = _protect_strings(pattern_quote.split(text))
+
+    return text.replace(b"(", b" ( ").replace(b")", b" ) ").split(sep)
+
 def parse(text):
     """
     This is what amounts to a simple lisp parser for turning the server's
     returned messages into an intermediate format that's easier to deal
     with than the raw (often poorly formatted) text.
 
+    This parses generally, taking any lisp-like string and turning it into a
+    list of nested lists, where each nesting indicates a parenthesized
+    expression.  Ex: "(baz 0 (foo 1.5))" becomes ['baz', 0, ['foo', 1.5]].
+
+    Unlike parse_chars, this works a whole token at a time and keeps an
+    explicit stack of the lists that are still open, so that appending a value
+    never has to walk back down through the nesting.
+    """
+
+    cache = _atom_cache
+
+    # the list we're currently appending to, and the lists enclosing it
+    root = []
+    cur = root
+    stack = []
+
+    for tok in _tokenize(bytes(text)):
+        if tok == b"(":
+            new = []
+            cur.append(new)
+            stack.append(cur)
+            cur = new
+
+        elif tok == b")":
+            if not stack:
+                raise ValueError("Message text has unmatching parenthesis!")
+            cur = stack.pop()
+
+        # multiple spaces leave empty tokens behind, and there's nothing to
+        # append outside of the top-level expression.
+        elif tok and stack:
+            try:
+                cur.append(cache[tok])
+            except KeyError:
+                if len(cache) >= _ATOM_CACHE_LIMIT:
+                    cache.clear()
+
+                val = cache[tok] = _convert_atom(tok)
+                cur.append(val)
+
+    # make sure all of our parenthesis match
+    if stack or not root:
+        raise ValueError("Message text has unmatching parenthesis!")
+
+    # this returns the first and only message found
+    return root[0]
+
+# the bytes that can end an atom in a stream of messages
+_STREAM_DELIMITERS = frozenset(b" ()\0\n\r\t")
+
+class StreamParser:
+    """
+    An incremental version of parse.  Raw bytes are fed in as they arrive, and
+    every top-level expression is returned as soon as its closing parenthesis
+    has been seen.  Anything left unfinished at the end of a chunk is kept
+    until the next one, so expressions may be split across or concatenated
+    within chunks in any way.
+
+    Messages may be separated by spaces, newlines, or null terminators, which
+    makes this suitable for both server datagrams and message log files.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Throws away any partially parsed expression.
+        """
+
+        # the raw bytes of an atom or string that the next chunk may continue
+        self._tail = b""
+
+        # the list we're currently appending to, and the lists enclosing it
+        self._cur = None
+        self._stack = []
+
+    def feed(self, data):
+        """
+        Parses the given chunk of bytes, and returns a list of all the
+        top-level expressions completed by it, in the order they were closed.
+        """
+
+        buf = bytes(data)
+        if self._tail:
+            buf = self._tail + buf
+
+        # hold back a trailing atom, since the next chunk may continue it
+        cut = len(buf)
+        while cut > 0 and buf[cut - 1] not in _STREAM_DELIMITERS:
+            cut -= 1
+
+        self._tail = buf[cut:]
+        buf = buf[:cut]
+
+        if b'"' in buf:
+            parts = pattern_quote.split(buf)
+
+            # an even number of parts means that the last string is unclosed,
+            # so it has to wait for the rest of its text.
+            if len(parts) % 2 == 0:
+                self._tail = b'"' + parts.pop() + self._tail
+
+            buf = _protect_strings(parts)
+
+        tokens = buf.replace(b"\0", b" ").replace(b"(", b" ( ").replace(b")", b" ) ").split()
+
+        cache = _atom_cache
+        cur = self._cur
+        stack = self._stack
+        done = []
+
+        for tok in tokens:
+            if tok == b"(":
+                # the start of a new top-level expression has no parent list
+                # to append to, so it's marked as such on the stack.
+                new = []
+                if cur is not None:
+                    cur.append(new)
+                stack.append(cur)
+                cur = new
+
+            elif tok == b")":
+                # ignore stray closing parenthesis between expressions
+                if cur is None:
+                    continue
+
+                parent = stack.pop()
+                if parent is None:
+                    done.append(cur)
+                cur = parent
+
+            # there's nothing to append outside of a top-level expression
+            elif cur is not None:
+                try:
+                    cur.append(cache[tok])
+                except KeyError:
+                    if len(cache) >= _ATOM_CACHE_LIMIT:
+                        cache.clear()
+
+                    val = cache[tok] = _convert_atom(tok)
+                    cur.append(val)
+
+        self._cur = cur
+        return done
+
+class LazyMessage:
+    """
+    A raw message that's only parsed when its contents are first needed.
+    """
+
+    def __init__(self, raw):
+        self.raw = bytes(raw)
+        self._parsed = None
+
+    @property
+    def head(self):
+        """
+        The type of the message, read without parsing the rest of it.
+        """
+
+        return peek_head(self.raw).decode()
+
+    @property
+    def parsed(self):
+        """
+        The message parsed into nested lists, as returned by parse.
+        """
+
+        if self._parsed is None:
+            self._parsed = parse(self.raw)
+
+        return self._parsed
+
+def _nested_parens(depth):
+    """
+    Returns a regular expression matching a single balanced group of
+    parenthesis, with nothing else in it, nested at most 'depth' deep.
+    """
+
+    expr = rb"\(\)"
+    for i in range(depth - 1):
+        expr = rb"\((?:" + expr + rb")*+\)"
+
+    return expr
+
+# every byte but the parenthesis, deleted from a message to leave only its
+# nesting.
+_NON_PARENS = bytes(c for c in range(256) if c not in b"()")
+
+# matches the parenthesis of exactly one whole message.  the server's
+# messages are only ever nested a few deep.
+pattern_single_parens = re.compile(_nested_parens(8))
+
+# caches whether the parenthesis left of a message make a single message.
+# messages of the same type nearly always share them (see messages only
+# differ by their number of objects), so the cache is almost always hit.  it's
+# emptied once it grows past its limit.
+_single_parens_cache = {}
+_SINGLE_PARENS_CACHE_LIMIT = 4096
+
+# matches a whole quoted string, which may hold parenthesis that don't count
+pattern_string = re.compile(rb'"(?:[^"\\]|\\.)*"')
+
+# matches every parenthesis and quoted string in a message, in order.  a
+# string that isn't closed runs to the end of the text.
+pattern_structure = re.compile(rb'[()]|"(?:[^"\\]|\\.)*"?')
+
+def _is_single_message(text):
+    """
+    Returns whether a piece of raw message text is exactly one whole message,
+    with nothing around it to strip.  This takes a single pass over the text,
+    which also catches several expressions run together.
+    """
+
+    if text[:1] != b"(" or text[-1:] != b")" or b"\n" in text:
+        return False
+
+    # strings are taken out first, and one that isn't closed fails the check
+    if b'"' in text:
+        text = pattern_string.sub(b"", text)
+        if b'"' in text:
+            return False
+
+    parens = text.translate(None, _NON_PARENS)
+    try:
+        return _single_parens_cache[parens]
+    except KeyError:
+        if len(_single_parens_cache) >= _SINGLE_PARENS_CACHE_LIMIT:
+            _single_parens_cache.clear()
+
+        single = pattern_single_parens.fullmatch(parens) is not None
+        _single_parens_cache[parens] = single
+        return single
+
+def _split_expressions(text):
+    """
+    Splits a piece of raw message text into its top-level expressions,
+    skipping over quoted strings.  Returns a list of the whole expressions,
+    the text of a last one that isn't closed yet (b"" if there's none), and
+    the number of stray closing parenthesis and atoms found outside of any
+    expression, which are thrown away.
+    """
+
+    done = []
+    stray = 0
+    depth = 0
+
+    # where the current expression, or the text before the next one, starts
+    start = 0
+
+    for m in pattern_structure.finditer(text):
+        i = m.start()
+        c = text[i]
+
+        # quoted strings don't change the depth
+        if c == 0x28:
+            if depth == 0:
+                if text[start:i].strip():
+                    stray += 1
+                start = i
+            depth += 1
+
+        elif c == 0x29:
+            if depth == 0:
+                stray += 1
+                start = i + 1
+                continue
+
+            depth -= 1
+            if depth == 0:
+                done.append(text[start:i + 1])
+                start = i + 1
+
+    if depth > 0:
+        return done, text[start:], stray
+
+    if text[start:].strip():
+        stray += 1
+
+    return done, b"", stray
+
+class MessageSplitter:
+    """
+    Splits a stream of raw bytes into the raw bytes of each complete message,
+    without parsing them, so that they can be handed to a type-specific decoder
+    or to parse.  A message split across chunks is kept until the rest of it
+    arrives.
+
+    Messages must be separated by a null terminator or a newline, as the server
+    and its message logs always do.  Like StreamParser, several expressions
+    run together without a separator are returned as separate messages.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Throws away any partially received message.
+        """
+
+        # the raw bytes of the last, still unfinished message
+        self._tail = b""
+
+        # the number of malformed messages that have been thrown away
+        self.dropped = 0
+
+    def feed(self, data):
+        """
+        Returns a list of the raw bytes of every message completed by the given
+        chunk of bytes, in the order they were received.
+        """
+
+        buf = bytes(data)
+        if self._tail:
+            buf = self._tail + buf
+        self._tail = b""
+
+        if b"\n" in buf:
+            buf = buf.replace(b"\n", b"\0")
+        pieces = buf.split(b"\0")
+
+        # everything before the last separator is complete.  the last
+        # piece may still be waiting for the rest of its text.
+        last = pieces.pop()
+
+        done = []
+        for piece in pieces:
+            piece = piece.strip()
+            if not piece:
+                continue
+
+            if _is_single_message(piece):
+                done.append(piece)
+                continue
+
+            # several expressions run together, strings, or malformed text
+            expressions, rest, stray = _split_expressions(piece)
+            done.extend(expressions)
+            self.dropped += stray + (1 if rest else 0)
+
+        # the last piece is kept as it is, whitespace and all, so that an atom
+        # split between chunks is joined back together the way it was.  any
+        # whole expressions in it are returned already.
+        piece = last.strip()
+        if piece:
+            if _is_single_message(piece):
+                done.append(piece)
+            else:
+                expressions, self._tail, stray = _split_expressions(last)
+                done.extend(expressions)
+                self.dropped += stray
+
+        return done
+
+    def feed_buffer(self, buffer, size):
+        """
+        Does the same as feed for the first 'size' bytes of a reusable
+        bytearray, like the one Socket.recv_into_buffer fills.  When they're
+        a single whole message and nothing is waiting for the rest of an
+        earlier one, which is how the server sends every datagram, the message
+        is copied out of the buffer once, at its exact size, and returned.
+        """
+
+        # the fast path takes a datagram that's exactly one message and its
+        # null terminator.
+        end = size - 1
+        if not self._tail and size > 2 and buffer.find(b"\0", 0, size) == end:
+            msg = bytes(memoryview(buffer)[:end])
+            if _is_single_message(msg):
+                return [msg]
+
+        return self.feed(memoryview(buffer)[:size])
+
+def parse_stream(f, chunk_size=65536):
+    """
+    Parses every top-level expression in a binary file-like object, yielding
+    each one as it is completed.  Only one chunk and one unfinished expression
+    are held in memory at a time.
+    """
+
+    parser = StreamParser()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+
+        for expr in parser.feed(chunk):
+            yield expr
+
+def parse_chars(text):
+    """
+    This is what amounts to a simple lisp parser for turning the server's
+    returned messages into an intermediate format that's easier to deal
+    with than the raw (often poorly formatted) text.
+
     This parses generally, taking any lisp-like string and turning it into a
     list of nested lists, where each nesting indicates a parenthesized
     expression.  holding multiple top-level parenthesized expressions. Ex: "(baz
     0 (foo 1.5))" becomes ['baz', 0, ['foo', 1.5]].
+
+    This is the original character-at-a-time parser.  It's much slower than
+    parse, but is kept as a reference for checking and benchmarking it.
     """
 
     # make sure all of our parenthesis match
@@ -141,18 +734,18 @@ if __name__ == "__main__":
     # interactive mode if any args were specified
     if len(sys.argv) > 2:
         from pprint import pprint
-        with open(sys.argv[1], 'r') as f:
+        with open(sys.argv[1], 'rb') as f:
             for line in f:
                 print("raw message:\n")
-                print(line.strip())
+                print(line.strip().decode())
                 print()
                 print("parsed message:")
                 pprint(parse(line.strip()))
                 print("----")
-                raw_input()
+                input()
                 print()
     else:
-        # just parse the message file
-        with open(sys.argv[1], 'r') as f:
-            for line in f:
-                parse(line.strip())
+        # just parse the message file, streaming it in constant memory
+        with open(sys.argv[1], 'rb') as f:
+            for expr in parse_stream(f):
+                pass
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""
+Runs agents on an asyncio event loop instead of giving each one its own
+threads, so that a whole team can share one thread.  Every agent gets a
+datagram endpoint on the loop: messages are handled as they're received,
+commands are sent whenever a sense_body message arrives, and think is called
+right after a see or sense_body message is handled, before the loop moves on
+to other agents' datagrams.  Other new data has think scheduled as a
+callback instead.
+
+This is an experimental alternative to Agent.connect and Agent.play, which
+remain the way to run agents.  The loop saves the two threads per agent and
+some CPU time, but handles every agent's datagrams in turn on one thread, so
+the time from a datagram arriving to an agent thinking on it is longer than
+with threads.  'python -m soccerpy.benchmark runtime' measures both.
+
+Run as a module to put a team on the field, ex:
+
+    python -m soccerpy.runtime <team_name> <num_players>
+"""
+
+import asyncio
+import socket
+
+from . import handler
+from . import message_parser
+from . import sp_exceptions
+
+class DatagramSender:
+    """
+    Sends messages to the server through an event loop's datagram transport.
+    Stands in for sock.Socket in an agent's ActionHandler.
+    """
+
+    def __init__(self, host, port):
+        # where messages go.  the server answers the init message from a new
+        # port, which then replaces the one given here.
+        self.address = (host, port)
+
+        # set once the endpoint is created
+        self.transport = None
+
+    def send(self, msg, append_null_terminator=True):
+        """
+        Sends a message to the server.  Appends a null terminator by default.
+        """
+
+        if append_null_terminator:
+            msg = msg + "\0"
+
+        self.transport.sendto(str.encode(msg), self.address)
+
+class AgentProtocol(asyncio.DatagramProtocol):
+    """
+    Connects one agent to the server on an event loop.  Use connect to create
+    one.
+    """
+
+    def __init__(self, agent, host, port, teamname, version, loop):
+        self.agent = agent
+        self.teamname = teamname
+        self.version = version
+        self.loop = loop
+
+        self.sock = DatagramSender(host, port)
+        agent.attach(self.sock, teamname)
+
+        # splits received data into complete messages
+        self.splitter = message_parser.MessageSplitter()
+
+        # done once the server has answered the init message
+        self.replied = loop.create_future()
+
+        # whether think is called after new data, and the handle of a call to
+        # it already scheduled, if any.  any number of datagrams received
+        # before it runs lead to only one call.
+        self.playing = False
+        self.think_handle = None
+
+        # how many times think was called, and how many datagrams were received
+        self.think_count = 0
+        self.datagram_count = 0
+
+    def connection_made(self, transport):
+        self.sock.transport = transport
+        self.sock.send("(init %s (version %d))" % (self.teamname, self.version))
+
+    def datagram_received(self, data, address):
+        # the server talks to us from the address it answered the init from
+        self.sock.address = address
+        if not self.replied.done():
+            self.replied.set_result(address)
+
+        self.datagram_count += 1
+
+        send_commands = False
+        think_now = False
+        for msg in self.splitter.feed(data):
+            msg_type = self.agent.msg_handler.handle_message(msg)
+
+            # we send commands all at once every cycle, ie. whenever a
+            # 'sense_body' command is received
+            if msg_type == handler.ActionHandler.CommandType.SENSE_BODY:
+                send_commands = True
+                think_now = True
+            elif msg_type == "see":
+                think_now = True
+
+        if send_commands:
+            self.agent.wm.ah.send_commands()
+
+        # think on what we've just seen or sensed right away, rather than
+        # behind every other agent's waiting datagrams.
+        if think_now:
+            self._think()
+        else:
+            self.schedule_think()
+
+    def error_received(self, exc):
+        # datagrams are unreliable anyway, so lost ones are simply missed
+        pass
+
+    def schedule_think(self):
+        """
+        Has think called soon, if the agent is playing and it isn't already
+        going to be.
+        """
+
+        if self.playing and self.think_handle is None:
+            self.think_handle = self.loop.call_soon(self._think)
+
+    def _think(self):
+        # a call scheduled earlier is covered by this one
+        if self.think_handle is not None:
+            self.think_handle.cancel()
+            self.think_handle = None
+
+        if self.playing:
+            self.think_count += 1
+            self.agent.think()
+
+    def play(self):
+        """
+        Starts the agent thinking, once right away and then whenever new data
+        arrives.  Raises an error if it's already playing.
+        """
+
+        if not self.replied.done():
+            raise sp_exceptions.AgentConnectionStateError(
+                "Must be connected to a server to begin play.")
+
+        if self.playing:
+            raise sp_exceptions.AgentAlreadyPlayingError(
+                "Agent is already playing.")
+
+        self.agent.setup_environment()
+        self.playing = True
+        self.schedule_think()
+
+    def disconnect(self):
+        """
+        Stops the agent thinking, tells the server that we're quitting, and
+        closes the endpoint.
+        """
+
+        self.playing = False
+
+        if self.sock.transport is not None:
+            self.sock.send("(bye)")
+            self.sock.transport.close()
+
+async def connect(agent, host, port, teamname, version=11):
+    """
+    Connects the given Agent to the server as one player on a team, on the
+    running event loop.  Returns its AgentProtocol once the server has
+    answered.
+    """
+
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: AgentProtocol(agent, host, port, teamname, version, loop),
+        local_addr=("0.0.0.0", 0))
+
+    # like sock.Socket, use the receive buffer size the agent asks for
+    if agent.receive_buffer_size is not None:
+        transport.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, agent.receive_buffer_size)
+
+    await protocol.replied
+    return protocol
+
+async def run_team(agent_class, count, host, port, teamname, version=11):
+    """
+    Connects 'count' instances of the given Agent class to the server, one
+    after another so that they get their uniform numbers in order, then
+    plays them until cancelled.
+    """
+
+    protocols = []
+    try:
+        for i in range(count):
+            protocols.append(await connect(agent_class(), host, port, teamname,
+                                           version))
+
+        for p in protocols:
+            p.play()
+
+        # play until we're cancelled
+        await asyncio.Future()
+    finally:
+        for p in protocols:
+            p.disconnect()
+
+if __name__ == "__main__":
+    import sys
+
+    from .agent import Agent
+
+    # enforce corrent number of arguments, print help otherwise
+    if len(sys.argv) < 3:
+        print("args: python -m soccerpy.runtime <team_name> <num_players>")
+        sys.exit()
+
+    count = min(11, int(sys.argv[2]))
+    print("Playing soccer with %d agents on one event loop..." % count)
+
+    try:
+        asyncio.run(run_team(Agent, count, "localhost", 6000, sys.argv[1]))
+    except KeyboardInterrupt:
+        print()
+        print("Exiting.")
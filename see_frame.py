@@ -0,0 +1,369 @@
+import numpy as np
+
+from . import game_object
+
+# missing values are stored as NaN in the frame's columns
+NAN = float("nan")
+
+def _value(x):
+    """
+    Converts a value read from a column into a python float, or None if it's
+    missing.
+    """
+
+    x = float(x)
+    if x != x:
+        return None
+
+    return x
+
+def _flat(array):
+    """
+    Returns a flat memoryview of the items of the given array, in order.
+    Setting single items through it is much faster than through the array.
+    """
+
+    return memoryview(array).cast("B").cast(array.dtype.char)
+
+class ObjectTable:
+    """
+    Holds one kind of object seen in a see message as preallocated columns, one
+    row per object.  The 'values' columns are, in order: distance, direction,
+    dist_change, dir_change, body_dir, and neck_dir.  The 'ids' column holds an
+    integer id whose meaning depends on the kind of object, -1 if unknown.
+
+    A decoder fills a table by writing straight into 'flat_values', six values
+    per row, and 'flat_ids', then setting 'count'.  Tables grow as needed, but
+    are never shrunk, so after the first few frames filling a table doesn't
+    allocate anything.
+    """
+
+    # the index of each of the 'values' columns
+    DISTANCE = 0
+    DIRECTION = 1
+    DIST_CHANGE = 2
+    DIR_CHANGE = 3
+    BODY_DIR = 4
+    NECK_DIR = 5
+
+    def __init__(self, capacity):
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.values = np.full((capacity, 6), NAN)
+        self.ids = np.full(capacity, -1, dtype=np.intp)
+
+        self.flat_values = _flat(self.values)
+        self.flat_ids = _flat(self.ids)
+
+    def reserve(self, capacity):
+        """
+        Makes room for at least 'capacity' rows, throwing away the contents if
+        the table has to grow.
+        """
+
+        if capacity > len(self.ids):
+            self._allocate(max(capacity, 2 * len(self.ids)))
+            self.count = 0
+
+    @property
+    def distance(self):
+        return self.values[:self.count, ObjectTable.DISTANCE]
+
+    @property
+    def direction(self):
+        return self.values[:self.count, ObjectTable.DIRECTION]
+
+    @property
+    def dist_change(self):
+        return self.values[:self.count, ObjectTable.DIST_CHANGE]
+
+    @property
+    def dir_change(self):
+        return self.values[:self.count, ObjectTable.DIR_CHANGE]
+
+    @property
+    def body_dir(self):
+        return self.values[:self.count, ObjectTable.BODY_DIR]
+
+    @property
+    def neck_dir(self):
+        return self.values[:self.count, ObjectTable.NECK_DIR]
+
+    @property
+    def id(self):
+        return self.ids[:self.count]
+
+class PlayerTable(ObjectTable):
+    """
+    An ObjectTable for players.  Its ids are uniform numbers, and it has extra
+    columns for the index of the player's team name in 'team_names' and for
+    its side (see SIDES), both -1 if unknown, filled through 'flat_teams' and
+    'flat_sides'.
+    """
+
+    # the side each value of the 'sides' column stands for
+    SIDES = ("l", "r")
+
+    def __init__(self, capacity):
+        ObjectTable.__init__(self, capacity)
+
+        # every team name seen, in the order first seen
+        self.team_names = []
+
+    def _allocate(self, capacity):
+        ObjectTable._allocate(self, capacity)
+        self.teams = np.full(capacity, -1, dtype=np.intp)
+        self.sides = np.full(capacity, -1, dtype=np.intp)
+
+        self.flat_teams = _flat(self.teams)
+        self.flat_sides = _flat(self.sides)
+
+    def team_index(self, teamname):
+        """
+        Returns the index of the given team name in 'team_names', adding it if
+        it's new.  Returns -1 for None.
+        """
+
+        if teamname is None:
+            return -1
+
+        try:
+            return self.team_names.index(teamname)
+        except ValueError:
+            self.team_names.append(teamname)
+            return len(self.team_names) - 1
+
+class ObjectView:
+    """
+    A lightweight, read-only stand-in for a GameObject that reads its data
+    from a row of an ObjectTable.  Missing values read as None, just like
+    they're stored on GameObjects.
+
+    Views read whatever their frame holds now, so they're only good until the
+    frame is refilled by a later see message.  That can't happen while the
+    world model's see data is held (see WorldModel.hold_see_data), which an
+    agent's think loop does while it thinks.  Anything kept longer must copy
+    the values it needs.
+    """
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    @property
+    def distance(self):
+        return _value(self._table.values[self._row, ObjectTable.DISTANCE])
+
+    @property
+    def direction(self):
+        return _value(self._table.values[self._row, ObjectTable.DIRECTION])
+
+class FlagView(ObjectView):
+    __slots__ = ()
+
+    @property
+    def flag_id(self):
+        index = self._table.ids[self._row]
+        if index < 0:
+            return None
+
+        return game_object.Flag.FLAG_IDS[index]
+
+class GoalView(ObjectView):
+    __slots__ = ()
+
+    @property
+    def goal_id(self):
+        index = self._table.ids[self._row]
+        if index < 0:
+            return None
+
+        return SeeFrame.GOAL_IDS[index]
+
+class LineView(ObjectView):
+    __slots__ = ()
+
+    @property
+    def line_id(self):
+        index = self._table.ids[self._row]
+        if index < 0:
+            return None
+
+        return SeeFrame.LINE_IDS[index]
+
+class MobileView(ObjectView):
+    __slots__ = ()
+
+    # see messages don't give speeds.  the ball's absolute velocity is kept by
+    # the world model's ball_tracker instead.
+    speed = None
+
+    @property
+    def dist_change(self):
+        return _value(self._table.values[self._row, ObjectTable.DIST_CHANGE])
+
+    @property
+    def dir_change(self):
+        return _value(self._table.values[self._row, ObjectTable.DIR_CHANGE])
+
+class BallView(MobileView):
+    __slots__ = ()
+
+class PlayerView(MobileView):
+    __slots__ = ()
+
+    @property
+    def team(self):
+        index = self._table.teams[self._row]
+        if index < 0:
+            return None
+
+        return self._table.team_names[index]
+
+    @property
+    def side(self):
+        index = self._table.sides[self._row]
+        if index < 0:
+            return None
+
+        return PlayerTable.SIDES[index]
+
+    @property
+    def uniform_number(self):
+        number = self._table.ids[self._row]
+        if number < 0:
+            return None
+
+        return int(number)
+
+    @property
+    def body_direction(self):
+        return _value(self._table.values[self._row, ObjectTable.BODY_DIR])
+
+    @property
+    def neck_direction(self):
+        return _value(self._table.values[self._row, ObjectTable.NECK_DIR])
+
+class ObjectViews:
+    """
+    A read-only sequence of the views of every object in an ObjectTable, so
+    that a table can be used wherever a list of GameObjects was before.
+    """
+
+    __slots__ = ("_table", "_view_class", "_count")
+
+    def __init__(self, table, view_class):
+        self._table = table
+        self._view_class = view_class
+
+        # the table is reused by later frames, so remember its current size
+        self._count = table.count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("object index out of range")
+
+        return self._view_class(self._table, i)
+
+    def __iter__(self):
+        view_class = self._view_class
+        table = self._table
+        for i in range(self._count):
+            yield view_class(table, i)
+
+class SeeFrame:
+    """
+    Holds everything seen in a single see message as a struct of arrays, one
+    ObjectTable per kind of object, instead of as a list of GameObjects.
+
+    Frames are meant to be reused: filling a frame overwrites what it held
+    before, so a frame must not be refilled while its data is still in use.
+    The world model's frame pool (see game_object.ReusePool) makes sure of
+    that while the think loop holds it.
+    """
+
+    # the number of frames a world model's pool starts with
+    POOL_SIZE = 3
+
+    # the ids of goals and lines, by their index in the tables' id columns
+    GOAL_IDS = ("l", "r")
+    LINE_IDS = ("l", "r", "t", "b")
+
+    # maps the raw names of goals and lines in see messages to their ids
+    GOAL_NAME_INDEX = {b"g l": 0, b"g r": 1}
+    LINE_NAME_INDEX = {b"l l": 0, b"l r": 1, b"l t": 2, b"l b": 3}
+
+    def __init__(self):
+        # the simulation cycle the frame was seen in
+        self.time = None
+
+        self.flag_table = ObjectTable(64)
+        self.goal_table = ObjectTable(4)
+        self.line_table = ObjectTable(8)
+        self.player_table = PlayerTable(32)
+        self.ball_table = ObjectTable(1)
+
+    def reserve(self, count):
+        """
+        Makes room for 'count' objects of every kind, throwing away the
+        contents of any table that has to grow.
+        """
+
+        self.flag_table.reserve(count)
+        self.goal_table.reserve(count)
+        self.line_table.reserve(count)
+        self.player_table.reserve(count)
+
+    @property
+    def flags(self):
+        return ObjectViews(self.flag_table, FlagView)
+
+    @property
+    def goals(self):
+        return ObjectViews(self.goal_table, GoalView)
+
+    @property
+    def lines(self):
+        return ObjectViews(self.line_table, LineView)
+
+    @property
+    def players(self):
+        return ObjectViews(self.player_table, PlayerView)
+
+    @property
+    def ball(self):
+        """
+        A view of the ball, or None if the ball wasn't seen.
+        """
+
+        if self.ball_table.count == 0:
+            return None
+
+        return BallView(self.ball_table, 0)
+
+    def flag_arrays(self):
+        """
+        Returns the integer indexes, distances, and directions of the flags
+        with known ids, in the form of WorldModel.index_flags.  These are
+        copies, since the world model keeps them after the frame is reused.
+        """
+
+        table = self.flag_table
+        ids = table.id
+        if table.count == 0 or ids.min() >= 0:
+            return ids.copy(), table.distance.copy(), table.direction.copy()
+
+        known = ids >= 0
+        return ids[known], table.distance[known], table.direction[known]
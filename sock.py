@@ -1,15 +1,23 @@
 import socket
 
+# the flag that makes a single receive return right away instead of waiting
+# for data, where the platform has one.
+DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
 class Socket:
     """
     Handles the barest level of UDP communication with a server in a slightly
     simpler way (for our purposes) than the default socket library.
     """
 
-    def __init__(self, host, port, bufsize=8192):
+    def __init__(self, host, port, bufsize=8192, rcvbuf=None):
         """
         host: hostname of the server we want to connect to
         port: port of the server we want to connect to
+        bufsize: the largest datagram received in one piece
+        rcvbuf: the size of the kernel's receive buffer (SO_RCVBUF), ie. how
+                much data can wait for us before datagrams are lost.  the
+                system default if None.
         """
 
         self.address = (host, port)
@@ -17,7 +25,31 @@ class Socket:
 
         # the socket communication with the server takes place on (ipv4, udp)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    
+
+        if rcvbuf is not None:
+            self.set_receive_buffer_size(rcvbuf)
+
+        # reused by recv_into_buffer for every datagram, instead of
+        # allocating new bytes for each.
+        self.buffer = bytearray(bufsize)
+
+    def set_receive_buffer_size(self, size):
+        """
+        Asks the kernel for a receive buffer (SO_RCVBUF) of the given size in
+        bytes, and returns the size it actually gave, which may differ (Linux
+        doubles it, and caps it at net.core.rmem_max).
+        """
+
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        return self.receive_buffer_size()
+
+    def receive_buffer_size(self):
+        """
+        Returns the size of the kernel's receive buffer (SO_RCVBUF) in bytes.
+        """
+
+        return self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
     def send(self, msg, append_null_terminator=True):
         """
         Sends a message to the server.  Appends a null terminator by default.
@@ -42,3 +74,92 @@ class Socket:
             self.address = address
 
         return data
+
+    def recv_into_buffer(self, conform_address=True):
+        """
+        Receives data like recv, but into this socket's reusable 'buffer'
+        instead of new bytes, and returns how many bytes were received.  The
+        data is only there until the next call, so it has to be handled, or
+        copied, before then.
+        """
+
+        size, address = self.sock.recvfrom_into(self.buffer)
+
+        if conform_address:
+            self.address = address
+
+        return size
+
+    def recv_pending(self, limit=64, conform_address=True):
+        """
+        Waits for data like recv, then also receives every datagram that has
+        already arrived after it, up to 'limit' in all, without waiting for
+        more.  Returns the data of each as a list, oldest first.  Lets a
+        receiver that fell behind catch up on everything queued at once.
+        """
+
+        datagrams = [self.recv(conform_address)]
+
+        while len(datagrams) < limit:
+            try:
+                data, address = self._recv_nowait()
+            except BlockingIOError:
+                break
+
+            if conform_address:
+                self.address = address
+
+            datagrams.append(data)
+
+        return datagrams
+
+    def recv_pending_into_buffer(self, limit=64, conform_address=True):
+        """
+        Does the same as recv_pending, but receives every datagram into this
+        socket's reusable 'buffer', like recv_into_buffer, and yields how many
+        bytes each one was.  Each datagram has to be handled, or copied,
+        before the next one is asked for, since it overwrites the buffer.
+        """
+
+        yield self.recv_into_buffer(conform_address)
+
+        for i in range(limit - 1):
+            try:
+                size, address = self._recv_nowait_into()
+            except BlockingIOError:
+                return
+
+            if conform_address:
+                self.address = address
+
+            yield size
+
+    def _recv_nowait(self):
+        """
+        Receives a single datagram if one has arrived, raising
+        BlockingIOError otherwise.
+        """
+
+        if DONTWAIT:
+            return self.sock.recvfrom(self.bufsize, DONTWAIT)
+
+        self.sock.setblocking(False)
+        try:
+            return self.sock.recvfrom(self.bufsize)
+        finally:
+            self.sock.setblocking(True)
+
+    def _recv_nowait_into(self):
+        """
+        Receives a single datagram into 'buffer' if one has arrived, like
+        _recv_nowait.
+        """
+
+        if DONTWAIT:
+            return self.sock.recvfrom_into(self.buffer, 0, DONTWAIT)
+
+        self.sock.setblocking(False)
+        try:
+            return self.sock.recvfrom_into(self.buffer)
+        finally:
+            self.sock.setblocking(True)
@@ -0,0 +1,130 @@
+import numpy as np
+
+from . import geometry
+
+class PlayerIndex:
+    """
+    Holds the absolute positions of the players seen in one see message as
+    arrays, for answering many 'who is near here' questions at once instead
+    of looking at every player once per question.
+
+    Every query takes which players to consider: TEAMMATES, ENEMIES, or ALL.
+    Like the world model always has, players on our side are teammates and
+    every other player is an enemy, so players whose side is unknown count
+    as enemies.  While our own side is unknown, they count as teammates.
+    """
+
+    # the groups of players a query can consider
+    ALL = "all"
+    TEAMMATES = "teammates"
+    ENEMIES = "enemies"
+
+    def __init__(self, players, positions, sides, our_side):
+        """
+        'players' are the seen players, 'positions' an (n, 2) array of their
+        absolute positions, and 'sides' an array of their sides as numbers,
+        -1 where unknown.  'our_side' is our own side, in the same form.
+        """
+
+        self.players = players
+        self.positions = geometry.as_points(positions)
+
+        teammates = np.asarray(sides) == our_side
+
+        self.masks = {
+            PlayerIndex.ALL: np.ones(len(players), dtype=bool),
+            PlayerIndex.TEAMMATES: teammates,
+            PlayerIndex.ENEMIES: ~teammates,
+        }
+
+    def __len__(self):
+        return len(self.players)
+
+    def _select(self, which):
+        """
+        Returns the indexes of the players in the given group.
+        """
+
+        return np.flatnonzero(self.masks[which])
+
+    def distances(self, points, which=ALL):
+        """
+        Returns the distance from every given point to every player in the
+        given group, as an (m, k) array, along with the indexes of those k
+        players.  'points' is a single (x, y) point or a sequence of them.
+        """
+
+        points = geometry.as_points(points)
+        selected = self._select(which)
+
+        return geometry.distance_matrix(points, self.positions[selected]), selected
+
+    def nearest(self, point, which=ALL):
+        """
+        Returns the player in the given group nearest to a point, or None if
+        there isn't one.
+        """
+
+        players = self.k_nearest(point, 1, which)
+        if not players:
+            return None
+
+        return players[0]
+
+    def k_nearest(self, point, k, which=ALL):
+        """
+        Returns up to 'k' players in the given group, nearest to the point
+        first.
+        """
+
+        distances, selected = self.distances(point, which)
+        distances = distances[0]
+
+        if k < len(distances):
+            # only sort the k nearest
+            nearest = np.argpartition(distances, k)[:k]
+            order = nearest[np.argsort(distances[nearest])]
+        else:
+            order = np.argsort(distances)
+
+        return [self.players[i] for i in selected[order]]
+
+    def within_radius(self, point, radius, which=ALL):
+        """
+        Returns the players in the given group no further than 'radius' from
+        the point, nearest first.
+        """
+
+        distances, selected = self.distances(point, which)
+        distances = distances[0]
+
+        close = np.flatnonzero(distances <= radius)
+        order = close[np.argsort(distances[close])]
+
+        return [self.players[i] for i in selected[order]]
+
+    def nearest_to_points(self, points, which=ALL):
+        """
+        Returns the player in the given group nearest to each of the given
+        points, and the distance to it, as a list of (player, distance)
+        tuples.  Both are None for every point if the group is empty.
+        """
+
+        distances, selected = self.distances(points, which)
+        if len(selected) == 0:
+            return [(None, None)] * len(distances)
+
+        nearest = distances.argmin(axis=1)
+        nearest_distances = distances[np.arange(len(distances)), nearest]
+
+        return [(self.players[selected[i]], float(d))
+                for i, d in zip(nearest, nearest_distances)]
+
+    def count_within_radius(self, points, radius, which=ALL):
+        """
+        Returns an array of how many players in the given group are no further
+        than 'radius' from each of the given points.
+        """
+
+        distances, _ = self.distances(points, which)
+        return (distances <= radius).sum(axis=1)
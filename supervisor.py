@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import numpy as np
+from . import geometry
 from .agent import Agent
 from .world_model import WorldModel
 
@@ -13,6 +14,10 @@ class Supervisor(Agent):
         'turn-40': 4,
     }
 
+    # the environment vector only needs what we see, our body state, and the
+    # play mode from the referee.
+    subscriptions = ('see', 'sense_body', 'hear')
+
     def __init__(self, agent, action_dict=None):
         super().__init__()
         self._agent = agent
@@ -35,15 +40,6 @@ class Supervisor(Agent):
 
     def transform_wm(self, wm):
 
-        ball_visible = 1 if wm.ball else 0
-
-        if ball_visible:
-            ball_direction = wm.ball.direction if wm.ball.direction else 0
-            ball_distance = wm.ball.distance if wm.ball.distance else 0
-        else:
-            ball_direction = self.env[0]
-            ball_distance = self.env[1]
-
         # Resolve the goal side of the agent.
         if wm.side == WorldModel.SIDE_R:
             self.goal_side = WorldModel.SIDE_L
@@ -65,36 +61,25 @@ class Supervisor(Agent):
             goal = None
             own_goal = None
 
-        goal_visible = 1 if goal else 0
-        own_goal_visible = 1 if own_goal else 0
-
-        if goal_visible:
-            goal_direction = goal.direction if goal.direction else 0
-            goal_distance = goal.distance if goal.distance else 0
-        else:
-            goal_direction = self.env[2]
-            goal_distance = self.env[3]
-
-        if own_goal_visible:
-            own_goal_direction = own_goal.direction if own_goal.direction else 0
-            own_goal_distance = own_goal.distance if own_goal.distance else 0
-        else:
-            own_goal_direction = self.env[4]
-            own_goal_distance = self.env[5]
-
         # Add the 2 goals to the supervisor object.
         self.goal = goal
         self.own_goal = own_goal
 
-        self.env[0] = ball_direction
-        self.env[1] = ball_distance
-        self.env[2] = goal_direction
-        self.env[3] = goal_distance
-        self.env[4] = own_goal_direction
-        self.env[5] = own_goal_distance
-        self.env[6] = ball_visible
-        self.env[7] = goal_visible
-        self.env[8] = own_goal_visible
+        # The direction and distance of the ball, goal and own goal, NaN where
+        # unknown.  A visible object missing either gets 0 for it, and one that
+        # isn't visible keeps its last values.
+        objects = (wm.ball, goal, own_goal)
+        visible = np.array([o is not None for o in objects])
+
+        observed = geometry.as_values(
+            [value for o in objects
+             for value in ((o.direction, o.distance) if o is not None
+                           else (None, None))])
+
+        self.env[:6] = np.where(visible.repeat(2),
+                                geometry.with_default(observed, 0),
+                                self.env[:6])
+        self.env[6:9] = visible
 
         print('env = {}\n'.format(self.env))
 
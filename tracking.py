@@ -0,0 +1,421 @@
+import math
+
+import numpy as np
+
+from . import geometry
+from . import spatial
+
+def relative_velocity(distance, direction, dist_change, dir_change):
+    """
+    Returns the (x, y) velocity of a seen object relative to the player, from
+    the distance and direction it's seen at and the changes in them the
+    server reports, or None if any of those are missing.  'direction' is the
+    object's absolute direction from the player, in degrees.
+
+    The server reports the part of the relative velocity along the line to
+    the object as 'dist_change', and the part across it as 'dir_change', in
+    degrees per cycle as seen from the player.  Like all relative directions
+    it sends, 'dir_change' is measured the opposite way from our absolute
+    angles.
+    """
+
+    if (distance is None or direction is None or dist_change is None or
+            dir_change is None):
+        return None
+
+    angle = math.radians(direction)
+    ex = math.cos(angle)
+    ey = math.sin(angle)
+
+    across = -math.radians(dir_change) * distance
+
+    return (dist_change * ex - across * ey, dist_change * ey + across * ex)
+
+class BallTracker:
+    """
+    Keeps track of the ball's absolute position and velocity from one see
+    message to the next, and predicts where it'll be over the next few cycles.
+
+    Predictions are worked out for all of the next 'horizon' cycles at once,
+    the first time they're asked for after an observation, and reused until
+    the next one.
+    """
+
+    # the number of cycles predicted ahead
+    HORIZON = 50
+
+    def __init__(self, server_parameters, horizon=HORIZON):
+        self.server_parameters = server_parameters
+        self.horizon = horizon
+
+        # the last observed absolute position and velocity of the ball, as
+        # arrays, and the simulation cycle they were observed in.  velocity is
+        # None until it's known.
+        self.position = None
+        self.velocity = None
+        self.time = None
+
+        # the predicted positions and velocities of the ball for the cycles
+        # after the last observation, None until asked for.
+        self._positions = None
+        self._velocities = None
+
+    def observe(self, time, position, velocity=None):
+        """
+        Records the ball at the given absolute position, and with the given
+        absolute velocity if it's known, in the given simulation cycle.  If
+        the velocity isn't known, it's worked out from where the ball was last
+        seen.
+        """
+
+        position = np.array(position, dtype=float)
+
+        if velocity is not None:
+            velocity = np.array(velocity, dtype=float)
+        elif (self.position is not None and time is not None and
+                self.time is not None and 0 < time - self.time <= self.horizon):
+            # the ball slows down by 'ball_decay' every cycle, so moving
+            # 'v (1 - decay^n) / (1 - decay)' in n cycles means it started
+            # out at speed v and is now at 'v decay^n'.
+            cycles = time - self.time
+            decay = self.server_parameters.ball_decay
+            travel = (1 - decay ** cycles) / (1 - decay)
+            velocity = (position - self.position) / travel * decay ** cycles
+
+        self.position = position
+        self.velocity = velocity
+        self.time = time
+
+        # any earlier prediction is out of date
+        self._positions = None
+        self._velocities = None
+
+    def _predict(self):
+        """
+        Works out the ball's position and velocity for every cycle up to the
+        horizon, all at once.
+        """
+
+        decay = self.server_parameters.ball_decay
+        velocity = self.velocity
+        if velocity is None:
+            velocity = np.zeros(2)
+
+        # row n of each is the ball's state n cycles after the observation
+        decays = decay ** np.arange(self.horizon + 1)
+        travel = (1 - decays) / (1 - decay)
+
+        self._positions = self.position + travel[:, np.newaxis] * velocity
+        self._velocities = decays[:, np.newaxis] * velocity
+
+    def predictions(self):
+        """
+        Returns arrays of the predicted positions and velocities of the ball for
+        every cycle from the last observation up to the horizon, one row per
+        cycle, or None if the ball hasn't been seen.
+        """
+
+        if self.position is None:
+            return None
+
+        if self._positions is None:
+            self._predict()
+
+        return self._positions, self._velocities
+
+    def predict_position(self, time):
+        """
+        Returns the predicted (x, y) position of the ball in the given
+        simulation cycle, or None if the ball hasn't been seen.  Cycles past
+        the horizon get the position at the horizon.
+        """
+
+        state = self.predict_state(time)
+        if state is None:
+            return None
+
+        position, _ = state
+        return (float(position[0]), float(position[1]))
+
+    def predict_state(self, time):
+        """
+        Returns arrays of the predicted position and velocity of the ball in
+        the given simulation cycle, or None if the ball hasn't been seen.
+        Cycles past the horizon get the state at the horizon.
+        """
+
+        if self.position is None:
+            return None
+
+        cycles = 0
+        if time is not None and self.time is not None:
+            cycles = min(max(time - self.time, 0), self.horizon)
+
+        positions, velocities = self.predictions()
+        return positions[cycles], velocities[cycles]
+
+class PlayerTracker:
+    """
+    Keeps track of every player seen, from one see message to the next, so
+    that players keep their history even when the server doesn't say who
+    they are.
+
+    Every see, each seen player is matched to a track: by side and uniform
+    number when both are known, otherwise to the nearest track close enough
+    to where the track's player could have moved since it was last seen.
+    Players that match no track start new ones.  Tracks are stored as arrays,
+    one row per track, and each keeps a fixed-size history of its positions
+    and velocities.
+
+    The players nearest to us and whether either team has the ball are worked
+    out once per see, so that they can be read without looking at every
+    player again.
+    """
+
+    # the number of tracks there's room for at first
+    CAPACITY = 32
+
+    # the number of past positions and velocities kept for every track
+    HISTORY = 16
+
+    # tracks not seen for this many cycles are dropped
+    MAX_AGE = 50
+
+    # a track only matches a player within this many meters of where the
+    # track's player could be, on top of how far it could have run.
+    GATE_MARGIN = 2.0
+
+    def __init__(self, server_parameters, capacity=CAPACITY, history=HISTORY):
+        self.server_parameters = server_parameters
+
+        # the current state of every track
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.times = np.zeros(capacity, dtype=np.intp)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        # every track's side (0 for left, 1 for right) and uniform number, -1
+        # while unknown, and team name, None while unknown.
+        self.sides = np.full(capacity, -1, dtype=np.intp)
+        self.uniform_numbers = np.full(capacity, -1, dtype=np.intp)
+        self.teams = [None] * capacity
+
+        # the last 'history' positions and velocities of every track, the
+        # cycles they're from, and where the next one goes.
+        self.history_positions = np.zeros((capacity, history, 2))
+        self.history_velocities = np.zeros((capacity, history, 2))
+        self.history_times = np.full((capacity, history), -1, dtype=np.intp)
+        self.history_next = np.zeros(capacity, dtype=np.intp)
+
+        # the track of every player in the last see message, in the same order
+        self.matches = np.zeros(0, dtype=np.intp)
+
+        # the PlayerIndex of the players in the last see message
+        self.index = spatial.PlayerIndex([], np.zeros((0, 2)), [], -1)
+
+        # the results of the queries worked out every see.  players are the
+        # ones from the last see message, or None.
+        self.nearest_teammate = None
+        self.nearest_enemy = None
+        self.ball_owned_by_us = False
+        self.ball_owned_by_enemy = False
+
+    def _grow(self):
+        """
+        Doubles the number of tracks there's room for.
+        """
+
+        capacity = len(self.active)
+        self.positions = np.concatenate((self.positions,
+                                         np.zeros((capacity, 2))))
+        self.velocities = np.concatenate((self.velocities,
+                                          np.zeros((capacity, 2))))
+        self.times = np.concatenate((self.times,
+                                     np.zeros(capacity, dtype=np.intp)))
+        self.active = np.concatenate((self.active,
+                                      np.zeros(capacity, dtype=bool)))
+        self.sides = np.concatenate((self.sides,
+                                     np.full(capacity, -1, dtype=np.intp)))
+        self.uniform_numbers = np.concatenate(
+            (self.uniform_numbers, np.full(capacity, -1, dtype=np.intp)))
+        self.teams.extend([None] * capacity)
+
+        history = self.history_positions.shape[1]
+        self.history_positions = np.concatenate(
+            (self.history_positions, np.zeros((capacity, history, 2))))
+        self.history_velocities = np.concatenate(
+            (self.history_velocities, np.zeros((capacity, history, 2))))
+        self.history_times = np.concatenate(
+            (self.history_times, np.full((capacity, history), -1,
+                                         dtype=np.intp)))
+        self.history_next = np.concatenate(
+            (self.history_next, np.zeros(capacity, dtype=np.intp)))
+
+    def _new_track(self):
+        """
+        Returns the index of an unused track, making room for one if needed.
+        """
+
+        free = np.flatnonzero(~self.active)
+        if len(free) == 0:
+            self._grow()
+            free = np.flatnonzero(~self.active)
+
+        track = int(free[0])
+        self.active[track] = True
+        self.velocities[track] = 0
+        self.sides[track] = -1
+        self.uniform_numbers[track] = -1
+        self.teams[track] = None
+        self.history_times[track] = -1
+        self.history_next[track] = 0
+
+        return track
+
+    def update(self, time, players, positions, sides, uniform_numbers, our_side,
+               our_position, ball_position=None):
+        """
+        Matches the players of a see message to tracks and updates them.
+
+        'players' are the seen players, 'positions' an (n, 2) array of their
+        absolute positions, and 'sides' and 'uniform_numbers' arrays of their
+        sides (0 for left, 1 for right) and uniform numbers, -1 where unknown.
+        'our_side' is our own side, in the same form.  'ball_position' is the
+        ball's absolute position, if known.
+        """
+
+        count = len(players)
+
+        # forget the players that haven't been seen for too long
+        self.active &= (time - self.times) <= self.MAX_AGE
+
+        matches = np.full(count, -1, dtype=np.intp)
+
+        # players we know the identity of go with the track of that identity
+        identified = {}
+        for track in np.flatnonzero(self.active & (self.sides >= 0) &
+                                    (self.uniform_numbers >= 0)):
+            key = (self.sides[track], self.uniform_numbers[track])
+            identified[key] = track
+
+        for i in range(count):
+            if sides[i] >= 0 and uniform_numbers[i] >= 0:
+                track = identified.get((sides[i], uniform_numbers[i]))
+                if track is not None:
+                    matches[i] = track
+
+        # match the rest to the nearest free track that they could be, all
+        # at once: the distance from every player to every track, with pairs
+        # that can't match set to infinity.
+        unmatched = np.flatnonzero(matches < 0)
+        free = self.active.copy()
+        free[matches[matches >= 0]] = False
+        candidates = np.flatnonzero(free)
+
+        if len(unmatched) and len(candidates):
+            elapsed = np.maximum(time - self.times[candidates], 1)
+            predicted = (self.positions[candidates] +
+                         self.velocities[candidates] * elapsed[:, np.newaxis])
+            distances = geometry.distance_matrix(positions[unmatched],
+                                                 predicted)
+
+            gates = (self.server_parameters.player_speed_max * elapsed +
+                     self.GATE_MARGIN)
+            distances[distances > gates] = np.inf
+
+            # known sides and uniform numbers must agree
+            player_sides = sides[unmatched, np.newaxis]
+            track_sides = self.sides[candidates][np.newaxis, :]
+            distances[(player_sides >= 0) & (track_sides >= 0) &
+                      (player_sides != track_sides)] = np.inf
+
+            player_numbers = uniform_numbers[unmatched, np.newaxis]
+            track_numbers = self.uniform_numbers[candidates][np.newaxis, :]
+            distances[(player_numbers >= 0) & (track_numbers >= 0) &
+                      (player_numbers != track_numbers)] = np.inf
+
+            # pair off the closest player and track until no pairs are left
+            for flat in np.argsort(distances, axis=None):
+                row, column = divmod(int(flat), len(candidates))
+                if distances[row, column] == np.inf:
+                    break
+
+                if matches[unmatched[row]] < 0 and free[candidates[column]]:
+                    matches[unmatched[row]] = candidates[column]
+                    free[candidates[column]] = False
+
+        # start new tracks for everyone left over
+        new = matches < 0
+        for i in np.flatnonzero(new):
+            matches[i] = self._new_track()
+
+        # then update all the tracks at once.  new tracks start out still.
+        old = matches[~new]
+        elapsed = np.maximum(time - self.times[old], 1)[:, np.newaxis]
+        self.velocities[old] = (positions[~new] - self.positions[old]) / elapsed
+
+        self.positions[matches] = positions
+        self.times[matches] = time
+
+        known = sides >= 0
+        self.sides[matches[known]] = sides[known]
+        known = uniform_numbers >= 0
+        self.uniform_numbers[matches[known]] = uniform_numbers[known]
+
+        for i, p in enumerate(players):
+            if p.team is not None:
+                self.teams[matches[i]] = p.team
+
+        slots = self.history_next[matches]
+        self.history_positions[matches, slots] = self.positions[matches]
+        self.history_velocities[matches, slots] = self.velocities[matches]
+        self.history_times[matches, slots] = time
+        self.history_next[matches] = (slots + 1) % self.history_times.shape[1]
+
+        self.matches = matches
+        self._answer_queries(players, positions, sides, our_side, our_position,
+                             ball_position)
+
+    def _answer_queries(self, players, positions, sides, our_side, our_position,
+                        ball_position):
+        """
+        Indexes the players of the see message just tracked, and works out the
+        nearest teammate and enemy and who has the ball.
+        """
+
+        index = spatial.PlayerIndex(players, positions, sides, our_side)
+        self.index = index
+
+        self.nearest_teammate = None
+        self.nearest_enemy = None
+        self.ball_owned_by_us = False
+        self.ball_owned_by_enemy = False
+
+        if our_position is not None:
+            self.nearest_teammate = index.nearest(our_position,
+                                                  index.TEAMMATES)
+            self.nearest_enemy = index.nearest(our_position, index.ENEMIES)
+
+        if ball_position is not None:
+            margin = self.server_parameters.kickable_margin
+
+            self.ball_owned_by_us = bool(
+                index.count_within_radius(ball_position, margin,
+                                          index.TEAMMATES)[0])
+            self.ball_owned_by_enemy = bool(
+                index.count_within_radius(ball_position, margin,
+                                          index.ENEMIES)[0])
+
+    def history(self, track):
+        """
+        Returns the cycles, positions, and velocities in the history of the
+        given track, oldest first.
+        """
+
+        order = np.roll(np.arange(self.history_times.shape[1]),
+                        -self.history_next[track])
+        times = self.history_times[track, order]
+        kept = times >= 0
+
+        return (times[kept], self.history_positions[track, order][kept],
+                self.history_velocities[track, order][kept])
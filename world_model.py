@@ -1,9 +1,17 @@
 import math
 import random
 
+import numpy as np
+
 from . import message_parser
 from . import sp_exceptions
 from . import game_object
+from . import geometry
+from . import history
+from . import localization
+from .cycle_cache import CycleCache, cycle_cached
+from .see_frame import SeeFrame
+from . import tracking
 
 class WorldModel:
     """
@@ -67,15 +75,56 @@ class WorldModel:
             raise NotImplementedError("Don't instantiate a RefereeMessages class,"
                                       " access it statically through WorldModel instead.")
 
-    def __init__(self, action_handler):
+    class Localizers:
+        """
+        Static class containing the names of the methods the world model can
+        use to find the player's position from the flags it sees.
+        """
+
+        # random k-means clustering of points around every flag
+        CLUSTER = "cluster"
+
+        # deterministic weighted least-squares trilateration
+        TRILATERATE = "trilaterate"
+
+        # lookup of the best matching cell of a precomputed DistanceGrid
+        GRID = "grid"
+
+        # a PositionFilter, moved by our velocity every cycle and corrected by
+        # the flags on every see.
+        FILTER = "filter"
+
+        def __init__(self):
+            raise NotImplementedError("Don't instantiate a Localizers class,"
+                                      " access it statically through WorldModel instead.")
+
+    # the distance between the cells of the grid localizer's DistanceGrid
+    GRID_RESOLUTION = 1.0
+
+    # a number for every play mode, for storing play modes in arrays
+    PLAY_MODE_NUMBERS = dict((mode, i) for i, mode in enumerate(sorted(
+        v for k, v in vars(PlayModes).items() if k.isupper())))
+
+    def __init__(self, action_handler, localizer=Localizers.CLUSTER,
+                 grid_path=None, history_depth=0):
         """
         Create the world model with default values and an ActionHandler class it
         can use to complete requested actions.
+
+        'localizer' is how the player's position is found, one of the
+        Localizers.  The grid localizer's table is memory-mapped from
+        'grid_path' if it's given, so that every agent on the host can share
+        it.  If 'history_depth' isn't 0, a record of the state is kept for
+        that many of the last cycles (see history.WorldHistory).
         """
 
         # we use the action handler to complete complex commands
         self.ah = action_handler
 
+        # values derived from the current state, like object coordinates,
+        # remembered until the state next changes.
+        self.cycle_cache = CycleCache()
+
         # these variables store all objects for any particular game step
         self.ball = None
         self.flags = []
@@ -83,6 +132,25 @@ class WorldModel:
         self.players = []
         self.lines = []
 
+        # the SeeFrame holding the last see message, if it was stored as one.
+        # when it is, the object lists above hold views of it.
+        self.see_frame = None
+
+        # the reusable frames see messages are stored in.  see
+        # hold_see_data.
+        self.frame_pool = game_object.ReusePool(SeeFrame, SeeFrame.POOL_SIZE)
+
+        # reusable compact objects for see messages that aren't stored as
+        # frames.  see MessageHandler.pool_objects and hold_see_data.
+        self.object_pool = game_object.ObjectPool()
+
+        # the flags of the last see message with known ids, as parallel arrays
+        # of integer flag indexes (see Flag.FLAG_INDEX), distances, and
+        # directions.  missing distances are NaN.
+        self.flag_indexes = np.zeros(0, dtype=np.intp)
+        self.flag_distances = np.zeros(0)
+        self.flag_directions = np.zeros(0)
+
         # the default position of this player, its home position
         self.home_point = (None, None)
 
@@ -127,30 +195,87 @@ class WorldModel:
         self.abs_neck_dir = None
         self.abs_body_dir = None
 
+        # how the player's position is found, one of the Localizers.  the
+        # DistanceGrid the grid localizer needs is set up right away, since
+        # building it takes a while.
+        self.localizer = localizer
+        self.grid_path = grid_path
+        self.distance_grid = None
+        if localizer == WorldModel.Localizers.GRID:
+            self.distance_grid = self.load_distance_grid()
+
+        # keeps track of our position between see messages for the filter
+        # localizer.
+        self.position_filter = localization.PositionFilter()
+
         # create a new server parameter object for holding all server params
         self.server_parameters = ServerParameters()
 
+        # the simulation cycle of the last see message
+        self.sim_time = None
+
+        # the ball's absolute position and velocity, and where it's going
+        self.ball_tracker = tracking.BallTracker(self.server_parameters)
+
+        # every player seen, kept track of across see messages
+        self.player_tracker = tracking.PlayerTracker(self.server_parameters)
+
+        # the simulation cycle of the last sense_body message
+        self.body_time = None
+
+        # records of the state in the last few cycles, if they're kept
+        self.history = None
+        if history_depth:
+            self.history = history.WorldHistory(history_depth)
+
+    def hold_see_data(self):
+        """
+        Keeps the pooled objects or frames of the last see message, and those
+        of every see message stored from now on, from being reused until
+        release_see_data is called.  The think loop holds them while it
+        thinks, since the message loop keeps storing see messages meanwhile.
+        """
+
+        self.frame_pool.hold()
+        self.object_pool.hold()
+
+    def release_see_data(self):
+        """
+        Lets see messages reuse every pooled object and frame again.
+        """
+
+        self.frame_pool.release()
+        self.object_pool.release()
+
     def triangulate_direction(self, flags, flag_dict):
         """
         Determines absolute view angle for the player given a list of visible
-        flags.  We find the absolute angle to each flag, then return the average
-        of those angles.  Returns 'None' if no angle could be determined.
+        flags.  Every flag's absolute bearing from our position plus the
+        direction we see it in gives an estimate of the angle, and we return
+        the circular mean of those estimates.  Returns 'None' if no angle could
+        be determined.
         """
 
-        # average all flag angles together and save that as absolute angle
-        abs_angles = []
-        for f in self.flags:
+        coords = []
+        directions = []
+        for f in flags:
             # if the flag has useful data, consider it
-            if f.distance is not None and f.flag_id in flag_dict:
-                flag_point = flag_dict[f.flag_id]
-                abs_dir = self.angle_between_points(self.abs_coords, flag_point)
-                abs_angles.append(abs_dir)
+            if f.direction is not None and f.flag_id in flag_dict:
+                coords.append(flag_dict[f.flag_id])
+                directions.append(f.direction)
 
-        # return the average if available
-        if len(abs_angles) > 0:
-            return sum(abs_angles) / len(abs_angles)
+        return localization.heading(self.abs_coords,
+                                    np.array(coords, dtype=float).reshape(-1, 2),
+                                    np.array(directions, dtype=float))
 
-        return None
+    def triangulate_direction_arrays(self, flag_indexes, flag_directions):
+        """
+        Does the same as triangulate_direction, but for flags given as arrays
+        of integer flag indexes and directions (see index_flags).
+        """
+
+        coords = game_object.Flag.FLAG_COORDS_ARRAY[flag_indexes]
+        return localization.heading(self.abs_coords, coords, flag_directions)
 
     def triangulate_position(self, flags, flag_dict, angle_step=36):
         """
@@ -197,6 +322,83 @@ class WorldModel:
 
         return center_with_most_points
 
+    def triangulate_position_arrays(self, flag_indexes, flag_distances,
+                                    angle_step=36):
+        """
+        Does the same as triangulate_position, but for flags given as arrays
+        of integer flag indexes and distances (see index_flags), and with all
+        the work done on arrays instead of one point at a time.  Gets the same
+        result as triangulate_position, so long as the random module is in
+        the same state.
+        """
+
+        # points every 'angle_step' degrees around every flag with a distance,
+        # one row per flag.
+        known = ~np.isnan(flag_distances)
+        coords = game_object.Flag.FLAG_COORDS_ARRAY[flag_indexes[known]]
+        distances = flag_distances[known, np.newaxis]
+
+        cos, sin = self._unit_circle(angle_step)
+        xs = (coords[:, 0, np.newaxis] + distances * cos).ravel()
+        ys = (coords[:, 1, np.newaxis] + distances * sin).ravel()
+
+        # discard the points outside the play boundaries
+        on_field = (xs >= -60) & (xs <= 60) & (ys >= -40) & (ys <= 40)
+        points = np.column_stack((xs[on_field], ys[on_field]))
+
+        centers, counts = self.cluster_point_arrays(points)
+
+        # the center with the most points approximates our absolute position
+        if len(counts) == 0 or counts.max() == 0:
+            return (0, 0)
+
+        center = centers[counts.argmax()]
+        return (float(center[0]), float(center[1]))
+
+    # the cosines and sines of the angles used by triangulate_position_arrays,
+    # by angle step.
+    _unit_circles = {}
+
+    @staticmethod
+    def _unit_circle(angle_step):
+        """
+        Returns arrays of the cosine and sine of every 'angle_step' degrees
+        around a circle.
+        """
+
+        circle = WorldModel._unit_circles.get(angle_step)
+        if circle is None:
+            # computed with the math module, to get exactly the same values as
+            # triangulate_position.
+            angles = [math.radians(i) for i in range(0, 360, angle_step)]
+            circle = (np.array([math.cos(a) for a in angles]),
+                      np.array([math.sin(a) for a in angles]))
+            WorldModel._unit_circles[angle_step] = circle
+
+        return circle
+
+    def trilaterate_position(self, flag_indexes, flag_distances):
+        """
+        Returns the position best matching the distances to the flags with the
+        given integer indexes (see index_flags), found with weighted least
+        squares, or None if fewer than two flags have a distance.  Unlike
+        triangulate_position, this always gives the same result for the same
+        flags.
+        """
+
+        coords = game_object.Flag.FLAG_COORDS_ARRAY[flag_indexes]
+        return localization.trilaterate(coords, flag_distances)
+
+    def load_distance_grid(self):
+        """
+        Returns the DistanceGrid for the grid localizer, shared with every
+        other world model using the same file.
+        """
+
+        return localization.shared_grid(game_object.Flag.FLAG_COORDS_ARRAY,
+                                        WorldModel.GRID_RESOLUTION,
+                                        self.grid_path)
+
     def cluster_points(self, points, num_cluster_iterations=15):
         """
         Cluster a set of points into a dict of centers mapped to point lists.
@@ -258,55 +460,116 @@ class WorldModel:
         # return latest cluster iteration
         return latest
 
-    def euclidean_distance(self, point1, point2):
+    def cluster_point_arrays(self, points, num_cluster_iterations=15):
         """
-        Returns the Euclidean distance between two points on a plane.
+        Does the same k-means clustering as cluster_points on an (n, 2) array
+        of points, with the same random initial centers.  Returns an array of
+        the cluster centers of the last iteration and an array of how many
+        points were nearest to each.
         """
 
-        try:
-            x1 = point1[0]
-            y1 = point1[1]
-            x2 = point2[0]
-            y2 = point2[1]
+        # generate initial random centers, ignoring identical ones.  this is
+        # done exactly like cluster_points does it, to get the same centers.
+        centers = set([])
+        for i in range(int(math.sqrt(len(points) / 2))):
+            rand_center = (random.randint(-55, 55), random.randint(-35, 35))
+            centers.add(rand_center)
+
+        centers = np.array(list(centers), dtype=float).reshape(-1, 2)
+        counts = np.zeros(len(centers), dtype=np.intp)
+        if len(centers) == 0:
+            return centers, counts
+
+        for i in range(num_cluster_iterations):
+            # the distance from every point to every center, with the centers
+            # sorted so that, like cluster_points, ties go to the smallest one.
+            order = np.lexsort((centers[:, 1], centers[:, 0]))
+            distances = geometry.distance_matrix(points, centers[order])
+
+            # the index of every point's nearest center
+            nearest = order[distances.argmin(axis=1)]
+
+            counts = np.bincount(nearest, minlength=len(centers))
+
+            # the last iteration's centers are the ones we return
+            if i == num_cluster_iterations - 1:
+                break
+
+            # move every center to the average of its points, removing empty
+            # clusters.
+            sum_x = np.bincount(nearest, points[:, 0], minlength=len(centers))
+            sum_y = np.bincount(nearest, points[:, 1], minlength=len(centers))
+
+            used = counts > 0
+            centers = np.column_stack((sum_x[used], sum_y[used]))
+            centers /= counts[used, np.newaxis]
+
+            # like cluster_points, keep the centers in a set.  this drops
+            # identical centers and keeps them in the same order, so that ties
+            # are broken the same way.
+            centers = np.array(list(set(map(tuple, centers.tolist()))))
+
+        return centers, counts
+
+    def euclidean_distance(self, point1, point2):
+        """
+        Returns the Euclidean distance between two points on a plane, or NaN
+        if either point is unknown.
+        """
 
-            return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-        except BaseException:
-            return 200
+        return geometry.distance(point1, point2)
 
+    @cycle_cached
     def angle_between_points(self, point1, point2):
         """
         Returns the angle from the first point to the second, assuming that
         these points exist on a plane, and that the positive x-axis is 0 degrees
         and the positive y-axis is 90 degrees.  All returned angles are positive
-        and relative to the positive x-axis.
+        and relative to the positive x-axis.  Returns NaN if either point is
+        unknown.
+        """
+
+        return geometry.bearing(point1, point2)
+
+    def index_flags(self, flags):
+        """
+        Returns parallel arrays of the integer indexes, distances, and
+        directions of all the given flags that have a known id.  Missing
+        distances and directions are NaN.
         """
 
-        try:
-            x1 = point1[0]
-            y1 = point1[1]
-            x2 = point2[0]
-            y2 = point2[1]
+        flag_index = game_object.Flag.FLAG_INDEX
 
-            # get components of vector between the points
-            dx = x2 - x1
-            dy = y2 - y1
+        indexes = []
+        distances = []
+        directions = []
+        for f in flags:
+            i = flag_index.get(f.flag_id)
+            if i is None:
+                continue
 
-            # return the angle in degrees
-            a = math.degrees(math.atan2(dy, dx))
-            if a < 0:
-                a = 360 + a
+            indexes.append(i)
+            distances.append(f.distance)
+            directions.append(f.direction)
 
-            return a
-        except BaseException:
-            return 0
+        return (np.array(indexes, dtype=np.intp),
+                np.array(distances, dtype=float),
+                np.array(directions, dtype=float))
 
-    def process_new_info(self, ball, flags, goals, players, lines):
+    def process_new_info(self, ball, flags, goals, players, lines,
+                         flag_arrays=None):
         """
         Update any internal variables based on the currently available
         information.  This also calculates information not available directly
         from server-reported messages, such as player coordinates.
+
+        'flag_arrays' holds the arrays returned by index_flags for the given
+        flags, if they were already built while reading the message.
         """
 
+        # everything derived from the old state is out of date
+        self.cycle_cache.clear()
+
         # update basic information
         self.ball = ball
         self.flags = flags
@@ -314,21 +577,209 @@ class WorldModel:
         self.players = players
         self.lines = lines
 
+        if flag_arrays is None:
+            flag_arrays = self.index_flags(flags)
+        self.flag_indexes, self.flag_distances, self.flag_directions = flag_arrays
+
         # TODO: make all triangulate_* calculations more accurate
 
-        # update the apparent coordinates of the player based on all flag pairs
-        flag_dict = game_object.Flag.FLAG_COORDS
-        self.abs_coords = self.triangulate_position(self.flags, flag_dict)
+        # update the apparent coordinates of the player based on the flags
+        if self.localizer == WorldModel.Localizers.CLUSTER:
+            coords = self.triangulate_position_arrays(self.flag_indexes,
+                                                      self.flag_distances)
+        elif self.localizer == WorldModel.Localizers.GRID:
+            if self.distance_grid is None:
+                self.distance_grid = self.load_distance_grid()
+
+            coords = self.distance_grid.locate(self.flag_indexes,
+                                               self.flag_distances)
+        elif self.localizer == WorldModel.Localizers.FILTER:
+            flag_coords = game_object.Flag.FLAG_COORDS_ARRAY[self.flag_indexes]
+            coords = self.position_filter.correct(flag_coords,
+                                                  self.flag_distances)
+        else:
+            coords = self.trilaterate_position(self.flag_indexes,
+                                               self.flag_distances)
+
+        # without enough flags, stay where we last were
+        if coords is not None:
+            self.abs_coords = coords
 
         # set the neck and body absolute directions based on flag directions
-        self.abs_neck_dir = self.triangulate_direction(self.flags, flag_dict)
+        self.abs_neck_dir = self.triangulate_direction_arrays(
+            self.flag_indexes, self.flag_directions)
 
-        # set body dir only if we got a neck dir, else reset it
+        # set body dir only if we got a neck dir, else reset it.  like all
+        # relative directions the server sends, the neck direction is
+        # measured the opposite way from our absolute angles.
         if self.abs_neck_dir is not None and self.neck_direction is not None:
-            self.abs_body_dir = self.abs_neck_dir - self.neck_direction
+            self.abs_body_dir = (self.abs_neck_dir + self.neck_direction) % 360
         else:
             self.abs_body_dir = None
 
+        self.track_ball()
+        self.track_players()
+
+        # anything worked out on another thread while we were updating may
+        # have seen a mix of the old and new state.
+        self.cycle_cache.clear()
+
+    def get_velocity(self):
+        """
+        Returns our absolute (x, y) velocity, or None if it's unknown.
+        """
+
+        if (self.abs_neck_dir is None or self.speed_amount is None or
+                self.speed_direction is None):
+            return None
+
+        # the speed direction is relative to the neck, like all directions
+        return geometry.polar_to_point((0.0, 0.0), self.abs_neck_dir,
+                                       self.speed_amount, self.speed_direction)
+
+    def track_ball(self):
+        """
+        Gives the ball tracker the ball's absolute position, and its velocity
+        if the ball is close enough for the server to tell us how it's moving.
+        """
+
+        ball = self.ball
+        if ball is None:
+            return
+
+        position = geometry.polar_to_point(self.abs_coords, self.abs_neck_dir,
+                                           ball.distance, ball.direction)
+        if position is None:
+            return
+
+        # the ball's velocity is its velocity relative to us plus ours
+        direction = self.abs_neck_dir - ball.direction
+        velocity = tracking.relative_velocity(ball.distance, direction,
+                                              ball.dist_change,
+                                              ball.dir_change)
+        own_velocity = self.get_velocity()
+        if velocity is not None and own_velocity is not None:
+            velocity = (velocity[0] + own_velocity[0],
+                        velocity[1] + own_velocity[1])
+
+        self.ball_tracker.observe(self.sim_time, position, velocity)
+
+    # the number used for each side by the player tracker
+    SIDE_NUMBERS = {SIDE_L: 0, SIDE_R: 1}
+
+    def track_players(self):
+        """
+        Gives the player tracker the absolute positions of the players just
+        seen, and the ball's, for it to update its tracks and queries with.
+        """
+
+        players = []
+        positions = np.zeros((0, 2))
+        sides = []
+        uniform_numbers = []
+
+        # players can only be placed once we know where we are and which way
+        # we're looking.
+        our_position = None
+        if (not geometry.is_missing(self.abs_coords) and
+                self.abs_neck_dir is not None):
+            our_position = self.abs_coords
+
+            players = list(self.players)
+            positions = geometry.polar_to_cartesian(
+                our_position, self.abs_neck_dir,
+                [p.distance for p in players], [p.direction for p in players])
+
+            # players seen without a distance or direction can't be placed
+            placed = ~geometry.missing(positions)
+            if not placed.all():
+                players = [p for p, ok in zip(players, placed) if ok]
+                positions = positions[placed]
+
+            for p in players:
+                sides.append(WorldModel.SIDE_NUMBERS.get(p.side, -1))
+                uniform_numbers.append(p.uniform_number
+                                       if p.uniform_number is not None else -1)
+
+        self.player_tracker.update(self.sim_time or 0, players, positions,
+                                   np.array(sides, dtype=np.intp),
+                                   np.array(uniform_numbers, dtype=np.intp),
+                                   WorldModel.SIDE_NUMBERS.get(self.side, -1),
+                                   our_position,
+                                   self.ball_tracker.predict_position(self.sim_time))
+
+    def process_sense_body(self):
+        """
+        Update any internal variables that depend on the body information just
+        stored from a sense_body message, which comes every cycle.  For the
+        filter localizer, this moves our position by our current velocity.  If
+        history is kept, the cycle's record is added.
+        """
+
+        # everything derived from the old state is out of date
+        self.cycle_cache.clear()
+
+        if self.localizer == WorldModel.Localizers.FILTER:
+            self.predict_own_position()
+
+        if self.history is not None:
+            self.record_history()
+
+        # see process_new_info
+        self.cycle_cache.clear()
+
+    def predict_own_position(self):
+        """
+        Moves our position by our current velocity, for the filter localizer
+        between see messages.
+        """
+
+        # between see messages, assume the body hasn't turned, so the neck
+        # points wherever it's turned to relative to the body.
+        if self.abs_body_dir is not None and self.neck_direction is not None:
+            self.abs_neck_dir = (self.abs_body_dir - self.neck_direction) % 360
+
+        velocity = self.get_velocity()
+        if velocity is None:
+            return
+
+        self.position_filter.predict(*velocity)
+
+        position = self.position_filter.position
+        if position is not None:
+            self.abs_coords = (float(position[0]), float(position[1]))
+
+    def record_history(self):
+        """
+        Adds a record of the current state to the history.  Our position and
+        directions are as of the last see message, or as predicted since then
+        by the filter localizer, and the ball's are as the ball tracker
+        predicts them for this cycle.
+        """
+
+        ball_position = ball_velocity = (None, None)
+        ball = self.ball_tracker.predict_state(self.body_time)
+        if ball is not None:
+            ball_position, ball_velocity = ball
+
+        self.history.append((
+            self.body_time if self.body_time is not None else -1,
+            self.sim_time if self.sim_time is not None else -1,
+            self.abs_coords,
+            self.abs_neck_dir,
+            self.abs_body_dir,
+            ball_position,
+            ball_velocity,
+            self.stamina,
+            self.effort,
+            self.speed_amount,
+            self.speed_direction,
+            self.neck_direction,
+            WorldModel.PLAY_MODE_NUMBERS.get(self.play_mode, -1),
+            self.score_l,
+            self.score_r,
+        ))
+
     def is_playon(self):
         """
         Tells us whether it's play time
@@ -411,10 +862,13 @@ class WorldModel:
         # get absolute direction to the point
         abs_point_dir = self.angle_between_points(self.abs_coords, point)
 
+        # we can't aim without knowing where we are and which way we face
+        if math.isnan(point_dist) or self.abs_body_dir is None:
+            return
+
         # get relative direction to point from body, since kicks are relative to
         # body direction.
-        if self.abs_body_dir is not None:
-            rel_point_dir = self.abs_body_dir - abs_point_dir
+        rel_point_dir = geometry.normalize_angle(self.abs_body_dir - abs_point_dir)
 
         # we do a simple linear interpolation to calculate final kick speed,
         # assuming a kick of power 100 goes 45 units in the given direction.
@@ -469,6 +923,7 @@ class WorldModel:
 
         self.ah.turn_neck(obj.direction)
 
+    @cycle_cached
     def get_distance_to_point(self, point):
         """
         Returns the linear distance to some point on the field from the current
@@ -478,14 +933,20 @@ class WorldModel:
         return self.euclidean_distance(self.abs_coords, point)
 
     # Keng-added
+    @cycle_cached
     def get_angle_to_point(self, point):
         """
-        Returns the relative angle to some point on the field from self.
+        Returns the relative angle to some point on the field from self, in
+        [-180, 180), or NaN if it's unknown.
         """
 
+        if self.abs_body_dir is None:
+            return math.nan
+
         # calculate absolute direction to point
         # subtract from absolute body direction to get relative angle
-        return self.abs_body_dir - self.angle_between_points(self.abs_coords, point)
+        return geometry.normalize_angle(
+            self.abs_body_dir - self.angle_between_points(self.abs_coords, point))
 
     # Keng-added
     def turn_body_to_point(self, point):
@@ -495,14 +956,14 @@ class WorldModel:
 
         relative_dir = self.get_angle_to_point(point)
 
-        if relative_dir > 180:
-            relative_dir = relative_dir - 180
-        elif relative_dir < -180:
-            relative_dir = relative_dir + 180
+        # we can't turn towards a point without knowing where we are
+        if math.isnan(relative_dir):
+            return
 
         # turn to that angle
         self.ah.turn(relative_dir)
 
+    @cycle_cached
     def get_object_absolute_coords(self, obj):
         """
         Determines the absolute coordinates of the given object based on the
@@ -510,16 +971,9 @@ class WorldModel:
         calculated.
         """
 
-        # we can't calculate this without a distance to the object
-        if obj.distance is None:
-            return None
-
-        # get the components of the vector to the object
-        dx = obj.distance * math.cos(obj.direction)
-        dy = obj.distance * math.sin(obj.direction)
-
-        # return the point the object is at relative to our current position
-        return (self.abs_coords[0] + dx, self.abs_coords[1] + dy)
+        # like all relative directions, the object's is relative to our neck
+        return geometry.polar_to_point(self.abs_coords, self.abs_neck_dir,
+                                       obj.distance, obj.direction)
 
     def teleport_to_point(self, point):
         """
@@ -538,27 +992,21 @@ class WorldModel:
         if self.neck_direction is not None:
             self.ah.turn_neck(self.neck_direction * -1)
 
+    def get_player_index(self):
+        """
+        Returns the spatial.PlayerIndex of the players in the last see
+        message, for asking many questions about who is near where at once.
+        """
+
+        return self.player_tracker.index
+
     def get_nearest_teammate_to_point(self, point):
         """
-        Returns the uniform number of the fastest teammate to some point.
+        Returns the teammate player closest to some point, or None.
         """
 
-        # holds tuples of (player dist to point, player)
-        distances = []
-        for p in self.players:
-            # skip enemy and unknwon players
-            if p.side == self.side:
-                # find their absolute position
-                p_coords = self.get_object_absolute_coords(p)
-
-                distances.append((self.euclidean_distance(point, p_coords), p))
-
-        # return the nearest known teammate to the given point
-        try:
-            nearest = min(distances)[1]
-            return nearest
-        except BaseException:
-            return None
+        index = self.player_tracker.index
+        return index.nearest(point, index.TEAMMATES)
 
     # Keng-added
     def get_nearest_teammate(self):
@@ -566,27 +1014,8 @@ class WorldModel:
         Returns the teammate player closest to self.
         """
 
-        # holds tuples of (player dist to point, player)
-        distances = []
-        # print "checking from get_nearest_teammate"
-        # print "selfside", self.side
-        for p in self.players:
-            # print p.side
-            # print p.side == self.side
-            # skip enemy and unknwon players
-            if p.side == self.side:
-                # find their absolute position
-                p_coords = self.get_object_absolute_coords(p)
-
-                distances.append((self.get_distance_to_point(p_coords), p))
-
-        # print "finally", distances
-        # return the nearest known teammate to the given point
-        try:
-            nearest = min(distances)[1]
-            return nearest
-        except BaseException:
-            return None
+        # worked out by the player tracker on every see
+        return self.player_tracker.nearest_teammate
 
     # Keng-added
     def get_nearest_enemy(self):
@@ -594,22 +1023,7 @@ class WorldModel:
         Returns the enemy player closest to self.
         """
 
-        # holds tuples of (player dist to point, player)
-        distances = []
-        for p in self.players:
-            # skip enemy and unknwon players
-            if p.side != self.side:
-                # find their absolute position
-                p_coords = self.get_object_absolute_coords(p)
-
-                distances.append((self.get_distance_to_point(p_coords), p))
-
-        # return the nearest known teammate to the given point
-        try:
-            nearest = min(distances)[1]
-            return nearest
-        except BaseException:
-            return None
+        return self.player_tracker.nearest_enemy
 
     # Keng-added
     def is_ball_owned_by_us(self):
@@ -617,16 +1031,7 @@ class WorldModel:
         Returns if the ball is in possession by our team.
         """
 
-        # holds tuples of (player dist to point, player)
-        for p in self.players:
-            # skip enemy and unknwon players
-            if p.side == self.side and self.euclidean_distance(self.get_object_absolute_coords(
-                    self.ball), self.get_object_absolute_coords(p)) < self.server_parameters.kickable_margin:
-                return True
-            else:
-                continue
-
-        return False
+        return self.player_tracker.ball_owned_by_us
 
     # Keng-added
     def is_ball_owned_by_enemy(self):
@@ -634,16 +1039,7 @@ class WorldModel:
         Returns if the ball is in possession by the enemy team.
         """
 
-        # holds tuples of (player dist to point, player)
-        for p in self.players:
-            # skip enemy and unknwon players
-            if p.side != self.side and self.euclidean_distance(self.get_object_absolute_coords(
-                    self.ball), self.get_object_absolute_coords(p)) < self.server_parameters.kickable_margin:
-                return True
-            else:
-                continue
-
-        return False
+        return self.player_tracker.ball_owned_by_enemy
 
     def get_stamina(self):
         """